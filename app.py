@@ -1,18 +1,25 @@
 import streamlit as st
-from supabase import create_client, Client
+from supabase import create_client, acreate_client, Client
 from groq import Groq
 import pandas as pd
 import plotly.express as px
 import datetime
 import base64
 import json
-import io
-from PIL import Image
+import threading
+import contextvars
+import uuid
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+import math
+from collections import Counter, OrderedDict, defaultdict, deque
 
-import fitz  # PyMuPDF
-from pillow_heif import register_heif_opener
-
-register_heif_opener()
+import imaging
+from groq_scheduler import GroqScheduler, INTERACTIVE, NORMAL, BACKGROUND
+from tracing import Tracer, TracedSupabase
+from live_updates import LiveFeed
+from tutor_stream import TutorStream
 
 # ---------------------------------------------------------
 # 1. 고도화된 UI 스타일
@@ -51,14 +58,34 @@ st.markdown("""
 # ---------------------------------------------------------
 # 2. Supabase 및 Groq 연결
 # ---------------------------------------------------------
+# [추가] 계측: Supabase/Groq 호출과 이미지/DataFrame 단계를 사용자·페이지·rerun 태그가 붙은 스팬으로 기록
+@st.cache_resource
+def get_tracer():
+    return Tracer(jsonl_path=st.secrets.get("TRACE_JSONL_PATH"), prom_path=st.secrets.get("TRACE_PROM_PATH"))
+
+tracer = get_tracer()
+
 @st.cache_resource
 def init_clients():
-    supabase: Client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
-    groq_client = Groq(api_key=st.secrets["GROQ_API_KEY"])
-    return supabase, groq_client
+    if st.secrets.get("FAKE_SUPABASE"):
+        from fakes import FakeSupabase, installed
+        supabase = installed("supabase") or FakeSupabase()
+    else: supabase: Client = create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    if st.secrets.get("FAKE_GROQ"):
+        from fakes import FakeGroq, installed
+        groq_client = installed("groq") or FakeGroq()
+    else: groq_client = Groq(api_key=st.secrets["GROQ_API_KEY"], max_retries=0) # 재시도는 스케줄러가 담당
+    return TracedSupabase(supabase, get_tracer()), groq_client
 
 supabase, groq = init_clients()
 
+# [추가] 모든 Groq 호출은 프로세스 전역 스케줄러를 거친다 (모델별 동시성/TPM 예산, 우선순위, 재시도, 예비 모델)
+@st.cache_resource
+def get_llm_scheduler():
+    return GroqScheduler(groq, tracer=get_tracer())
+
+llm = get_llm_scheduler()
+
 def get_user_info(user_id):
     res = supabase.table("users").select("*").eq("user_id", user_id).execute()
     return res.data[0] if res.data else None
@@ -67,85 +94,871 @@ def update_user_status(user_id, status_key, new_value):
     supabase.table("users").update({status_key: new_value}).eq("user_id", user_id).execute()
 
 def toggle_bookmark(log_id, current_val):
-    supabase.table("logs").update({"is_bookmarked": not current_val}).eq("id", log_id).execute()
+    res = supabase.table("logs").update({"is_bookmarked": not current_val}).eq("id", log_id).execute()
+    for store in list_log_stores(): store.merge(res.data or []) # 북마크 캐시에는 새로 넣거나 뺀다
 
 def add_log(user_id, subject, question, answer, img_url=None, log_type="Text"):
-    return supabase.table("logs").insert({"user_id": user_id, "subject": subject, "question": question, "answer": answer, "image_url": img_url, "log_type": log_type}).execute()
+    res = supabase.table("logs").insert({"user_id": user_id, "subject": subject, "question": question, "answer": answer, "image_url": img_url, "log_type": log_type}).execute()
+    for store in list_log_stores(user_id): store.merge(res.data or [])
+    return res
+
+def get_logs(user_id, columns=None, full_history=False):
+    store = get_log_store(user_id, columns or STUDENT_LOG_COLUMNS)
+    store.sync()
+    if full_history: store.load_all()
+    return store.frame()
+
+def recent_logs(user_id, limit, store_cls=None):
+    """store_cls 캐시를 맞춘 뒤 최신 행을 limit 개까지 (dict 목록, 최신순)."""
+    store = get_log_store(user_id, STUDENT_LOG_COLUMNS, store_cls or LogStore)
+    store.sync()
+    return store.recent(limit)
+
+# [추가] 사용자별 증분 로그 캐시
+# 최초 1회만 최근 페이지를 가져오고, 이후에는 마지막으로 본 id보다 새로운 로그만 당겨온다.
+LOG_PAGE_SIZE = 200
+STUDENT_LOG_COLUMNS = ("id", "created_at", "subject", "question", "answer", "log_type", "is_bookmarked")
+CHAT_LOG_TYPES = ("Text", "Off_Topic")  # 대화 기록으로 보여줄 로그 종류
+
+class LogStore:
+    table = "logs"
+    filters = ()                # ((컬럼, 허용값들), ...): 서버에서 거르는 조건. 하위 클래스가 정한다
+    page_size = LOG_PAGE_SIZE
+
+    def __init__(self, user_id, columns):
+        self.user_id = user_id
+        self.columns = tuple(columns) + tuple(c for c, _ in self.filters if c not in columns) # 변경이 조건에 맞는지 보려면 필요
+        self.rows, self.by_id = [], {}  # rows: id 내림차순(최신순)
+        self.loaded, self.has_more = False, True
+        self.synced_at = None  # 마지막으로 DB 를 조회한 시각 (time.monotonic)
+        self.lock = threading.RLock()
+        self._frame, self._dirty = None, True
+
+    def _query(self):
+        query = supabase.table(self.table).select(",".join(self.columns)).eq("user_id", self.user_id)
+        for column, values in self.filters:
+            query = query.eq(column, values[0]) if len(values) == 1 else query.in_(column, list(values))
+        return query
+
+    def matches(self, row):
+        return all(row.get(column) in values for column, values in self.filters)
+
+    # 조회에 필요한 상태만 락 안에서 읽고, 네트워크 왕복은 락 밖에서 한다 (다른 세션/실시간 스레드가 같은 캐시에서 기다리지 않도록).
+    # 동시에 같은 구간을 받아도 apply 가 id 로 합치므로 결과는 같다.
+    def sync(self):
+        """처음이면 최근 한 페이지를, 아니면 마지막 id 이후의 새 로그만 가져온다. 실시간 구독 중이면 조회하지 않는다."""
+        with self.lock:
+            loaded, newest = self.loaded, (self.rows[0]["id"] if self.rows else 0)
+            if loaded:
+                live_since = live_feed.live_since(self.user_id) if live_feed and self.table == "logs" else None
+                if live_since is not None and self.synced_at >= live_since: return # 구독 이후 변경은 apply_change 로 이미 반영됨
+        started = time.monotonic()
+        if not loaded: data = self._query().order("id", desc=True).limit(self.page_size).execute().data or []
+        else: data = self._query().gt("id", newest).order("id", desc=True).execute().data or []
+        with self.lock:
+            if not self.loaded: self.has_more, self.loaded = len(data) == self.page_size, True
+            self.synced_at = max(self.synced_at or started, started)
+            self.apply(data)
+
+    def load_more(self):
+        """과거 기록을 한 페이지 더 불러온다. 더 불러올 기록이 없으면 False."""
+        if not self.loaded: self.sync()
+        with self.lock:
+            if not self.has_more: return False
+            oldest = self.rows[-1]["id"] if self.rows else None
+        query = self._query().order("id", desc=True).limit(self.page_size)
+        data = (query.lt("id", oldest) if oldest is not None else query).execute().data or []
+        with self.lock:
+            if len(data) < self.page_size: self.has_more = False
+            self.apply(data)
+        return bool(data)
+
+    def load_all(self):
+        while self.load_more(): pass
+
+    def recent(self, limit):
+        """최신 행을 limit 개까지 (복사본, 최신순). 불러온 구간에 모자라면 과거 페이지를 더 불러온다."""
+        while True:
+            with self.lock: found = [dict(r) for r in self.rows[:limit]]
+            if len(found) >= limit or not self.load_more(): return found
+
+    def apply(self, data):
+        """새로 받은(혹은 방금 쓴) 행을 병합한다. 이미 있는 id는 값만 갱신."""
+        if not data: return
+        with self.lock:
+            for row in data:
+                row = {c: row.get(c) for c in self.columns}
+                if row["id"] in self.by_id: self.by_id[row["id"]].update(row)
+                else:
+                    self.by_id[row["id"]] = row
+                    self.rows.append(row)
+            self.rows.sort(key=lambda r: r["id"], reverse=True)
+            self._dirty = True
+
+    def merge(self, data):
+        """방금 쓴 행이나 실시간 변경을 병합한다. 바뀌었으면 True.
+        수정으로 조건(filters)에서 벗어난 행은 빼고, 없던 행은 조건에 맞고 불러온 구간 안일 때만 넣는다 (구간 밖 과거 행은 무시)."""
+        changed = False
+        with self.lock:
+            for record in data:
+                values, row = {c: record[c] for c in self.columns if c in record}, self.by_id.get(record.get("id"))
+                if row is not None:
+                    if all(row.get(c) == v for c, v in values.items()): continue
+                    row.update(values)
+                    if not self.matches(row):
+                        del self.by_id[row["id"]]
+                        self.rows = [r for r in self.rows if r is not row]
+                elif self.matches(values) and (not self.has_more or not self.rows or values["id"] > self.rows[-1]["id"]):
+                    row = self.by_id[values["id"]] = {c: values.get(c) for c in self.columns}
+                    self.rows.append(row)
+                else: continue
+                changed = True
+            if changed:
+                self.rows.sort(key=lambda r: r["id"], reverse=True)
+                self._dirty = True
+        return changed
+
+    def apply_change(self, event, record):
+        """실시간 변경 한 건 (INSERT/UPDATE). 바뀌었으면 True (이 세션이 방금 쓴 행이면 이미 같은 값이라 False).
+        첫 조회 중에 들어온 새 행도 넣어 둔다 (조회 결과와는 id 로 합쳐진다). 그때의 수정은 가진 행에만 적용한다."""
+        with self.lock:
+            if event not in ("INSERT", "UPDATE"): return False
+            if not self.loaded and event == "UPDATE" and record.get("id") not in self.by_id: return False # 과거 행을 끼우면 페이지 경계가 어긋난다
+            return self.merge([record])
+
+    def frame(self):
+        """캐시된 행을 DataFrame으로 돌려준다. 변경이 있을 때만 다시 만든다."""
+        with self.lock:
+            if self._dirty:
+                with tracer.span(f"dataframe.{self.table}", rows=len(self.rows)):
+                    self._frame = pd.DataFrame(self.rows, columns=list(self.columns))
+                self._dirty = False
+            return self._frame
+
+class BookmarkStore(LogStore):
+    """북마크한 로그만 따로 캐시한다. 카드에는 몇 개만 보이므로 한 번에 조금씩 불러온다."""
+    filters = (("is_bookmarked", (True,)),)
+    page_size = 5
+
+class ChatStore(LogStore):
+    """채팅창에 그릴 대화 로그만 (사진 채점 등은 서버에서 거른다). 이전 대화 한 창은 많아야 한 페이지 조회."""
+    filters = (("log_type", CHAT_LOG_TYPES),)
+
+# 캐시마다 불러온 로그의 answer 전문을 들고 있으므로, 오래 안 쓰인 것부터(LRU) 버려 프로세스 메모리를 묶어 둔다.
+# 버려진 캐시를 아직 쥐고 있는 실행은 그대로 쓰고, 다음 실행에서 새로 만들어 다시 불러온다.
+LOG_STORE_MAX = 256                 # 프로세스에 유지할 캐시 수 (테이블·사용자·컬럼 조합)
+LOG_STORE_IDLE_SECONDS = 30 * 60    # 이 시간 동안 안 쓰인 캐시는 버린다
+
+@st.cache_resource
+def _log_store_registry():
+    return OrderedDict(), threading.Lock()  # key -> (store, 마지막 사용 시각), 오래된 것이 앞
+
+log_store_registry = _log_store_registry() # 실시간 피드 스레드에서도 쓰므로 실행마다 한 번 받아 둔다
+
+def get_log_store(user_id, columns, store_cls=LogStore):
+    stores, lock = log_store_registry
+    key, now = (store_cls.table, store_cls.__name__, user_id, tuple(columns)), time.monotonic() # 클래스 객체는 실행마다 새로 만들어지므로 이름으로 구분
+    with lock:
+        store = stores.pop(key, (None, None))[0] or store_cls(user_id, columns)
+        stores[key] = (store, now)
+        while len(stores) > LOG_STORE_MAX or next(iter(stores.values()))[1] < now - LOG_STORE_IDLE_SECONDS: stores.popitem(last=False)
+        return store
+
+def list_log_stores(user_id=None, table="logs"):
+    stores, lock = log_store_registry
+    with lock: return [s for (t, _, uid, _), (s, _) in stores.items() if t == table and (user_id is None or uid == user_id)]
+
+# [추가] 실시간 반영: Supabase Realtime 으로 users/logs 변경을 받아 로그 캐시에 바로 적용하고,
+# 그 사용자를 보고 있는 세션만 다시 그린다 (화면은 로컬 버전 카운터만 확인하므로 DB 폴링이 없다)
+LIVE_CHECK_SECONDS = 2
+
+def apply_live_change(table, event, record):
+    """변경 한 건을 캐시에 반영한다. 다시 그릴 필요가 있으면 True (이 세션이 방금 쓴 행이면 False)."""
+    if table != "logs": return True
+    changed = [store.apply_change(event, record) for store in list_log_stores(record.get("user_id"))]
+    return any(changed) or (event == "INSERT" and not changed)
+
+@st.cache_resource
+def get_live_feed():
+    if st.secrets.get("FAKE_SUPABASE"):
+        hub = supabase.realtime
+        async def connect(): return hub
+    elif st.secrets.get("SUPABASE_REALTIME", True):
+        url, key = st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]
+        async def connect(): return await acreate_client(url, key) # realtime 은 비동기 클라이언트에서만 동작
+    else: return None
+    return LiveFeed(connect, apply_live_change, tracer=get_tracer())
+
+live_feed = get_live_feed()
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def watch_live_changes(snapshot):
+    """snapshot(페이지를 그릴 때의 버전) 이후 바뀐 것이 있으면 세션 사용자 정보를 맞추고 전체를 다시 그린다."""
+    changed = live_feed.changed(snapshot)
+    if not changed: return
+    me = st.session_state['user']
+    row = live_feed.user_row(me['user_id']) if ("users", me['user_id']) in changed else None
+    if row:
+        if all(me.get(k) == v for k, v in row.items()) and changed == {("users", me['user_id'])}: return # 내 EXP 지급처럼 이미 반영된 변경
+        st.session_state['user'] = {**me, **row}
+    st.rerun()
 
-def get_logs(user_id):
-    res = supabase.table("logs").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
-    return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+def follow_live_changes(user_ids):
+    """페이지 맨 위에서 호출한다. 구독을 시작하고 변경 감시 프래그먼트를 건다.
+    모든 user_ids 의 구독이 확인됐을 때만 True (꺼져 있거나 아직 연결 전/실패면 False 이므로 화면은 수동 새로고침을 남겨 둔다)."""
+    if not live_feed: return False
+    for user_id in user_ids: live_feed.watch(user_id)
+    watch_live_changes(live_feed.snapshot(user_ids))
+    return all(live_feed.live_since(user_id) is not None for user_id in user_ids)
+
+# [추가] 문항 단위 채점 결과 인덱스 (grading_results 테이블)
+# 사진 채점 시점에 JSON을 한 번만 펼쳐 저장하고, 화면에서는 벡터 연산으로만 집계한다.
+KST = datetime.timezone(datetime.timedelta(hours=9))
+GRADE_COLUMNS = ("id", "log_id", "question_number", "is_correct", "core_concept", "subject", "created_at")
+
+class GradingIndex(LogStore):
+    table = "grading_results"
+
+    def frame(self):
+        with self.lock:
+            if self._dirty:
+                with tracer.span(f"dataframe.{self.table}", rows=len(self.rows)):
+                    df = pd.DataFrame(self.rows, columns=list(self.columns))
+                    df["is_correct"] = df["is_correct"].fillna(False).astype(bool)
+                    df["core_concept"] = df["core_concept"].fillna("기타").astype(str)
+                    df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601").dt.tz_convert(KST)
+                self._frame, self._dirty = df, False
+            return self._frame
+
+def grading_rows(user_id, log_id, subject, analysis_data):
+    return [{"log_id": log_id, "user_id": user_id, "subject": subject,
+             "question_number": str(item.get('question_number') or f'{idx+1}번'),
+             "is_correct": bool(item.get('is_correct', False)),
+             "core_concept": str(item.get('core_concept') or '기타')}
+            for idx, item in enumerate(analysis_data.get('results', []))] if log_id is not None else []
+
+def add_grading_results(user_id, rows):
+    if not rows: return
+    res = supabase.table("grading_results").insert(rows).execute()
+    for store in list_log_stores(user_id, GradingIndex.table): store.apply(res.data or [])
+
+def get_grading_index(user_id, full_history=False):
+    store = get_log_store(user_id, GRADE_COLUMNS, GradingIndex)
+    store.sync()
+    if full_history: store.load_all()
+    return store.frame()
+
+# [추가] 학생별 일별 롤업 (daily_rollups 테이블)
+# rollup_state 의 워터마크 이후 새 로그/채점 결과만 읽어 누적하므로, 대시보드는 전체 기록 대신 일별 행 몇 개만 읽는다.
+# 누적과 워터마크 이동은 apply_daily_rollups RPC 한 번(한 트랜잭션)이라, 중간에 실패해도 같은 기록을 두 번 세지 않는다.
+# id 는 커밋 순서가 아니라 INSERT 순서로 매겨지므로, 방금 쓴 행 앞에 아직 커밋 안 된 더 작은 id 가 있을 수 있다.
+# 그래서 ROLLUP_SETTLE_SECONDS 보다 오래된 행까지만 워터마크를 넘기고, 그 뒤의 최근 행은 화면에만 더해 보여 준다.
+ACTIVE_GAP_MINUTES = 10      # 이전 활동과의 간격이 이보다 짧으면 그 사이를 공부 시간으로 본다
+ACTIVE_SESSION_MINUTES = 1   # 새 세션을 시작한 활동 하나가 차지하는 시간
+ROLLUP_FETCH_SIZE = 1000
+ROLLUP_SETTLE_SECONDS = 10   # INSERT 트랜잭션이 이 시간의 절반 안에 커밋된다고 본다 (PostgREST 단건 INSERT)
+
+@st.cache_resource
+def _rollup_locks():
+    return defaultdict(threading.Lock)
+
+def _fetch_after(table, columns, user_id, after_id):
+    rows = []
+    while True:
+        data = supabase.table(table).select(columns).eq("user_id", user_id).gt("id", after_id).order("id").limit(ROLLUP_FETCH_SIZE).execute().data or []
+        rows += data
+        if len(data) < ROLLUP_FETCH_SIZE: return rows
+        after_id = data[-1]["id"]
+
+def _split_settled(rows, cutoff):
+    """id 순 rows 를 cutoff 이전에 만든 앞부분(워터마크를 넘겨도 되는 행)과 나머지로 나눈다."""
+    n = next((i for i, r in enumerate(rows) if datetime.datetime.fromisoformat(r["created_at"]) >= cutoff), len(rows))
+    return rows[:n], rows[n:]
+
+def _rollup_deltas(new_logs, new_grades, last_activity):
+    """로그/채점 결과로 {일자: 일별 증분} 을 만든다. (증분, 마지막 활동 시각)."""
+    kst_day = lambda ts: datetime.datetime.fromisoformat(ts).astimezone(KST).date().isoformat()
+    days = sorted({kst_day(r["created_at"]) for r in new_logs + new_grades})
+    rollups = {d: {"day": d, "questions_by_subject": {}, "graded_items": 0, "correct_items": 0, "wrong_concepts": {}, "active_minutes": 0} for d in days}
+    for log in new_logs:
+        row, ts = rollups[kst_day(log["created_at"])], datetime.datetime.fromisoformat(log["created_at"])
+        subject = log.get("subject") or "기타"
+        row["questions_by_subject"][subject] = row["questions_by_subject"].get(subject, 0) + 1
+        gap = (ts - last_activity).total_seconds() / 60 if last_activity else None
+        row["active_minutes"] += gap if gap is not None and 0 <= gap <= ACTIVE_GAP_MINUTES else ACTIVE_SESSION_MINUTES
+        last_activity = max(ts, last_activity) if last_activity else ts
+    for grade in new_grades:
+        row = rollups[kst_day(grade["created_at"])]
+        row["graded_items"] += 1
+        if grade["is_correct"]: row["correct_items"] += 1
+        else: row["wrong_concepts"][grade["core_concept"]] = row["wrong_concepts"].get(grade["core_concept"], 0) + 1
+    return rollups, last_activity
+
+def refresh_daily_rollups(user_id):
+    """마지막 처리 이후 새로 쌓인 로그와 채점 결과 중 자리 잡은 것만 일별 롤업에 반영하고, 남겨 둔 최근 행의 {일자: 증분} 을 돌려준다."""
+    with _rollup_locks()[user_id]:
+        res = supabase.table("rollup_state").select("*").eq("user_id", user_id).execute()
+        state = res.data[0] if res.data else {"user_id": user_id, "last_log_id": 0, "last_grade_id": 0, "last_activity_at": None}
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=ROLLUP_SETTLE_SECONDS)
+        new_logs, fresh_logs = _split_settled(_fetch_after("logs", "id,created_at,subject", user_id, state["last_log_id"]), cutoff)
+        new_grades, fresh_grades = _split_settled(_fetch_after("grading_results", "id,created_at,is_correct,core_concept", user_id, state["last_grade_id"]), cutoff)
+        last_activity = datetime.datetime.fromisoformat(state["last_activity_at"]) if state.get("last_activity_at") else None
+        if not new_logs and not new_grades: return _rollup_deltas(fresh_logs, fresh_grades, last_activity)[0]
+
+        rollups, last_activity = _rollup_deltas(new_logs, new_grades, last_activity)
+        # 워터마크가 읽은 값과 다르면(다른 프로세스가 먼저 반영) 서버가 아무것도 하지 않는다
+        supabase.rpc("apply_daily_rollups", {
+            "p_user_id": user_id, "p_deltas": list(rollups.values()),
+            "p_from_log_id": state["last_log_id"], "p_from_grade_id": state["last_grade_id"],
+            "p_last_log_id": new_logs[-1]["id"] if new_logs else state["last_log_id"],
+            "p_last_grade_id": new_grades[-1]["id"] if new_grades else state["last_grade_id"],
+            "p_last_activity_at": last_activity.isoformat() if last_activity else None,
+        }).execute()
+        return _rollup_deltas(fresh_logs, fresh_grades, last_activity)[0]
+
+def get_daily_rollups(user_id):
+    fresh = refresh_daily_rollups(user_id)
+    data = {row["day"]: row for row in supabase.table("daily_rollups").select("*").eq("user_id", user_id).order("day").execute().data or []}
+    for day, delta in fresh.items(): # 아직 롤업에 넣지 않은 최근 행은 화면에만 더한다
+        row = data.get(day)
+        data[day] = delta if row is None else {**row, **{k: row[k] + delta[k] for k in ("graded_items", "correct_items", "active_minutes")},
+                                               **{k: dict(Counter(row[k]) + Counter(delta[k])) for k in ("questions_by_subject", "wrong_concepts")}}
+    data = [data[day] for day in sorted(data)]
+    df = pd.DataFrame(data, columns=["day", "questions_by_subject", "graded_items", "correct_items", "wrong_concepts", "active_minutes"])
+    df["day"] = pd.to_datetime(df["day"]).dt.date
+    return df
+
+def summarize_rollups(rollups, days=7):
+    """대시보드 지표: 총 질문 수, 정답률(%), 과목별 질문 수, 오답 개념 빈도, 최근 N일 정답률 추이, 최근 N일 공부 시간(분)."""
+    by_subject = pd.Series(sum((Counter(d) for d in rollups["questions_by_subject"]), Counter()), dtype="int64")
+    wrong_counts = pd.Series(sum((Counter(d) for d in rollups["wrong_concepts"]), Counter()), dtype="int64").sort_values(ascending=False)
+    graded, correct = rollups["graded_items"].sum(), rollups["correct_items"].sum()
+    accuracy = int(correct / graded * 100) if graded else 0
+
+    today = datetime.datetime.now(KST).date()
+    recent = rollups[rollups["day"] > today - datetime.timedelta(days=days)]
+    trend = recent[recent["graded_items"] > 0]
+    trend = pd.DataFrame({"일자": [d.strftime("%m/%d") for d in trend["day"]], "정답률": (trend["correct_items"] / trend["graded_items"] * 100).round().astype(int)})
+    return int(by_subject.sum()), accuracy, by_subject, wrong_counts, trend, int(recent["active_minutes"].sum())
 
 # [추가] EXP 및 레벨업 시스템 로직
+# 지급은 award_exp RPC 한 번으로 원자적으로 처리되고(레벨업 루프도 서버에서), 한 번의 실행(rerun) 동안
+# 쌓인 지급분은 사용자별로 합쳐서 flush_exp()에서 한 번만 쓴다.
 def add_exp(user_id, amount):
-    user = get_user_info(user_id)
-    if not user: return
-    
-    current_level = user.get('level', 1)
-    current_exp = user.get('exp', 0)
-    new_exp = current_exp + amount
-    exp_needed = current_level * 100  # 레벨업 필요 경험치 (Lv.1: 100, Lv.2: 200...)
-    
-    if new_exp >= exp_needed:
-        current_level += 1
-        new_exp = new_exp - exp_needed
-        st.toast(f"🎉 축하합니다! Level {current_level}(으)로 레벨 업 달성!", icon="🏆")
-        
-    supabase.table("users").update({"level": current_level, "exp": new_exp}).eq("user_id", user_id).execute()
-    st.session_state['user'] = get_user_info(user_id) # 세션 갱신
+    pending = st.session_state.setdefault('pending_exp', {})
+    pending[user_id] = pending.get(user_id, 0) + amount
+
+def flush_exp(toast_now=True):
+    for user_id, amount in (st.session_state.pop('pending_exp', None) or {}).items():
+        show_exp_result(apply_exp(user_id, amount), toast_now)
+
+def apply_exp(user_id, amount):
+    """경험치를 즉시 반영하고 {"level", "exp", "levels_gained"} 를 돌려준다. UI를 건드리지 않으므로 작업 스레드에서도 호출 가능."""
+    return supabase.rpc("award_exp", {"p_user_id": user_id, "p_amount": amount}).execute().data
+
+def show_exp_result(result, toast_now=True):
+    if not result: return
+    if result.get('levels_gained'):
+        msg = f"🎉 축하합니다! Level {result['level']}(으)로 레벨 업 달성!"
+        if toast_now: st.toast(msg, icon="🏆")
+        else: st.session_state.setdefault('pending_toasts', []).append(msg) # st.rerun 직전이면 다음 실행에서 표시
+    if st.session_state.get('user', {}).get('user_id') == result.get('user_id'):
+        st.session_state['user'] = {**st.session_state['user'], 'level': result['level'], 'exp': result['exp']} # 세션 갱신
+
+def run_page(page):
+    """페이지를 그린 뒤 쌓인 EXP를 반영한다. st.rerun()으로 중단되는 경우에도 반영된다."""
+    try: page()
+    except BaseException:
+        flush_exp(toast_now=False); raise
+    flush_exp()
 
 # ---------------------------------------------------------
 # 3. AI 모델 로직
 # ---------------------------------------------------------
 def classify_subject(text):
-    prompt = f"다음 내용을 보고 '국어', '영어', '수학', '과학', '기타' 중 딱 하나로 대답해:\n\n{text}"
-    try: return groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.1, max_tokens=10).choices[0].message.content.strip()
+    try: return _classify_normalized(" ".join(str(text).lower().split())[:500])
     except: return "기타"
 
-def get_text_response(status, subject, question):
+@st.cache_data(max_entries=2048, show_spinner=False)
+def _classify_normalized(text):
+    """로컬 분류기가 확신하면 바로, 아니면 LLM에 물어본다. 정규화된 질문 단위로 LRU 메모이즈(실패는 캐시되지 않음)."""
+    subject, confident = get_subject_classifier().predict(text)
+    if confident: return subject
+    return classify_subject_llm(text)
+
+def classify_subject_llm(text):
+    prompt = f"다음 내용을 보고 '국어', '영어', '수학', '과학', '기타' 중 딱 하나로 대답해:\n\n{text}"
+    answer = llm.create(INTERACTIVE, model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.1, max_tokens=10).choices[0].message.content
+    subject = next((s for s in SUBJECTS if s in answer), "기타")
+    llm_subject_labels.append((text, subject))
+    return subject
+
+# [추가] 로컬 과목 분류기: 문자 n-gram 나이브 베이즈 (시드 키워드 + LLM 이 분류한 질문으로 학습)
+# logs.subject 에는 분류기 자신이 붙인 과목도 섞여 있어 그걸로 다시 학습하면 오분류가 굳어지므로, LLM 의 답만 모아 쓴다.
+SUBJECTS = ("국어", "영어", "수학", "과학", "기타")
+SUBJECT_SEED_KEYWORDS = {
+    "국어": "국어 시 소설 수필 문학 비문학 고전 문법 맞춤법 띄어쓰기 품사 어휘 한자어 속담 비유 은유 직유 화자 주제 중심문장 설명문 논설문 높임법 받침 자음 모음",
+    "영어": "영어 영단어 to부정사 동명사 관계대명사 현재완료 과거분사 수동태 be동사 시제 해석 영작 발음",
+    "수학": "수학 방정식 일차방정식 함수 분수 소수 약분 통분 곱셈 나눗셈 덧셈 뺄셈 구구단 도형 넓이 둘레 부피 각도 삼각형 사각형 원 확률 통계 미분 적분 인수분해 제곱근 비례식 좌표 그래프 수열 계산 + - = x^2",
+    "과학": "과학 물리 화학 생물 지구과학 원자 분자 원소 세포 광합성 호흡 전기 전류 자석 힘 속력 가속도 에너지 화학반응 산소 이산화탄소 태양계 행성 지층 화산 지진 유전 dna 실험 온도 물질",
+    "기타": "게임 유튜브 친구 노래 아이돌 축구 야구 놀이 점심 저녁 간식 배고파 심심해 재밌는 얘기 날씨 주말 안녕",
+}
+SUBJECT_CONFIDENCE_MARGIN = 0.35  # n-gram 당 평균 로그우도 차이가 이 값 이상이면 LLM 없이 확정
+SUBJECT_LATIN_SHARE = 0.5         # 글자 중 로마자 비율이 이보다 높으면 확정하지 않는다 (영어로 쓴 과학 질문 ≠ 영어 과목)
+SUBJECT_LLM_LABELS_MAX = 5000
+
+@st.cache_resource
+def _llm_subject_labels():
+    return deque(maxlen=SUBJECT_LLM_LABELS_MAX)  # (정규화된 질문, LLM 이 고른 과목)
+
+llm_subject_labels = _llm_subject_labels() # 채점 작업 스레드에서도 쓰므로 실행마다 한 번 받아 둔다
+
+def _char_ngrams(text, sizes=(1, 2, 3)):
+    text = f" {text} "
+    return [text[i:i + n] for n in sizes for i in range(len(text) - n + 1) if text[i:i + n].strip()]
+
+class SubjectClassifier:
+    def __init__(self):
+        self.counts = {s: Counter() for s in SUBJECTS}
+        self.docs = Counter()
+
+    def fit(self, samples):
+        for text, subject in samples:
+            if subject not in self.counts: continue
+            self.counts[subject].update(_char_ngrams(text))
+            self.docs[subject] += 1
+        vocab = set().union(*self.counts.values())
+        total_docs = sum(self.docs.values()) or 1
+        self.priors = {s: math.log((self.docs[s] + 1) / (total_docs + len(SUBJECTS))) for s in SUBJECTS}
+        self.loglik, self.unseen = defaultdict(dict), {}
+        for s, counter in self.counts.items():
+            denom = sum(counter.values()) + len(vocab) + 1
+            self.unseen[s] = math.log(1 / denom)
+            for gram, c in counter.items(): self.loglik[gram][s] = math.log((c + 1) / denom)
+        return self
+
+    def predict(self, text):
+        """(과목, 확신 여부)를 돌려준다. 대부분 로마자인 글은 글자 모양이 과목이 아니라 언어를 가리키므로 확신하지 않는다."""
+        grams = [g for g in _char_ngrams(text) if g in self.loglik]
+        if len(grams) < 2: return "기타", False
+        letters = [c for c in text if c.isalpha()]
+        latin = sum(c.isascii() for c in letters) / len(letters) if letters else 0
+        scores = {s: self.priors[s] + sum(self.loglik[g].get(s, self.unseen[s]) for g in grams) for s in SUBJECTS}
+        best, second = sorted(scores, key=scores.get, reverse=True)[:2]
+        return best, latin <= SUBJECT_LATIN_SHARE and (scores[best] - scores[second]) / len(grams) >= SUBJECT_CONFIDENCE_MARGIN
+
+@st.cache_resource(ttl=3600)
+def get_subject_classifier():
+    samples = [(" ".join(kw.lower().split()), s) for s, kws in SUBJECT_SEED_KEYWORDS.items() for kw in kws.split()]
+    return SubjectClassifier().fit(samples + list(llm_subject_labels))
+
+def stream_text_response(status, subject, question):
     system_content = f"당신은 '{subject}' 전담 튜터입니다. 만약 무관한 질문을 하면 맨 앞에 '[OFF_TOPIC]'을 붙이세요." if status == "studying" else "친절한 친구처럼 자유롭게 대화하세요."
-    res = groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "system", "content": system_content}, {"role": "user", "content": question}], temperature=0.6, max_tokens=1024).choices[0].message.content
-    return (res.replace("[OFF_TOPIC]", "").strip(), "Off_Topic") if "[OFF_TOPIC]" in res else (res, "Text")
+    return TutorStream(llm.create(INTERACTIVE, model="llama-3.3-70b-versatile", messages=[{"role": "system", "content": system_content}, {"role": "user", "content": question}], temperature=0.6, max_tokens=1024, stream=True))
 
-@st.cache_data(ttl=600)
-def get_ai_recommendations(logs_json):
-    try: return groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": f"학습 기록: {logs_json}. 추천 핵심 개념 3가지를 불릿 포인트(-)로 제안해."}], temperature=0.5, max_tokens=300).choices[0].message.content
+def get_ai_recommendations(user_id, rollups):
+    try: return get_ai_report(user_id, "recommendations", rollups, lambda summary: llm.create(BACKGROUND, model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": f"학습 기록 요약:\n{summary}\n\n추천 핵심 개념 3가지를 불릿 포인트(-)로 제안해."}], temperature=0.5, max_tokens=300).choices[0].message.content)["report"]
     except: return "- 학습 데이터 부족"
 
-def analyze_vulnerabilities(logs_json):
-    safe_logs = str(logs_json)[:4000]
-    prompt = f"학습 기록: {safe_logs}\n\n과목별 취약점을 분석하고 극복을 위한 추천 개념을 해시태그 형식(#개념)으로 포함해서 작성해줘."
-    try: return groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.4, max_tokens=1024).choices[0].message.content
-    except Exception as e: return f"⚠️ 분석 실패: {e}"
+def analyze_vulnerabilities(summary):
+    prompt = f"학습 기록 요약:\n{summary}\n\n과목별 취약점을 분석하고 극복을 위한 추천 개념을 해시태그 형식(#개념)으로 포함해서 작성해줘."
+    return llm.create(BACKGROUND, model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.4, max_tokens=1024).choices[0].message.content
+
+# [추가] AI 리포트 캐시 (ai_reports 테이블)
+# 원본 로그 대신 일별 롤업 요약으로 프롬프트를 만들어 기록이 아무리 쌓여도 입력 토큰이 일정하고,
+# 학생별로 저장해 두었다가 새 근거(질문+채점 문항)가 REPORT_MIN_NEW_EVIDENCE 개 이상 쌓였을 때만 다시 만든다.
+REPORT_MIN_NEW_EVIDENCE = 10
+REPORT_TOP_CONCEPTS = 8
+REPORT_TREND_DAYS = 14
+
+def build_report_summary(rollups):
+    """(몇 줄짜리 요약, 근거 수)를 돌려준다. 근거 수 = 누적 질문 수 + 채점 문항 수."""
+    total_q, accuracy, by_subject, wrong_counts, trend, minutes = summarize_rollups(rollups, days=REPORT_TREND_DAYS)
+    recent = rollups[rollups["day"] > datetime.datetime.now(KST).date() - datetime.timedelta(days=REPORT_TREND_DAYS)]
+    recent_wrong = pd.Series(sum((Counter(d) for d in recent["wrong_concepts"]), Counter()), dtype="int64").sort_values(ascending=False)
+    graded = int(rollups["graded_items"].sum())
+    counts = lambda series, unit="": ", ".join(f"{k} {v}{unit}" for k, v in series.head(REPORT_TOP_CONCEPTS).items()) or "없음"
+    lines = [f"누적 질문 {total_q}개, 채점 문항 {graded}개, 전체 정답률 {accuracy}%, 최근 {REPORT_TREND_DAYS}일 공부 시간 {minutes}분",
+             f"과목별 질문 수: {counts(by_subject.sort_values(ascending=False))}",
+             f"자주 틀린 개념(누적): {counts(wrong_counts, '회')}",
+             f"자주 틀린 개념(최근 {REPORT_TREND_DAYS}일): {counts(recent_wrong, '회')}",
+             f"최근 {REPORT_TREND_DAYS}일 일별 정답률: " + (", ".join(f"{d} {p}%" for d, p in zip(trend['일자'], trend['정답률'])) or "채점 기록 없음")]
+    return "\n".join(lines), total_q + graded
+
+def get_ai_report(user_id, kind, rollups, generate):
+    """저장된 리포트 이후 새 근거가 적으면 그대로, 아니면 generate(요약)로 새로 만들어 저장한다. 실패는 저장하지 않고 예외를 올린다."""
+    summary, evidence = build_report_summary(rollups)
+    cached = supabase.table("ai_reports").select("*").eq("user_id", user_id).eq("kind", kind).execute().data
+    if cached and evidence - cached[0]["evidence"] < REPORT_MIN_NEW_EVIDENCE: return cached[0]
+    state = supabase.table("rollup_state").select("last_log_id,last_grade_id").eq("user_id", user_id).execute().data
+    row = {"user_id": user_id, "kind": kind, "report": generate(summary), "evidence": evidence,
+           "last_log_id": state[0]["last_log_id"] if state else 0, "last_grade_id": state[0]["last_grade_id"] if state else 0,
+           "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    supabase.table("ai_reports").upsert(row, on_conflict="user_id,kind").execute()
+    return row
 
 def analyze_vision_json(b64_encoded_jpeg):
     prompt = """각 문제별로 분석해서 반드시 아래 JSON 형식(배열 포함)으로만 응답해: { "results": [ { "question_number": "1번", "is_correct": true, "status_text": "정답입니다!", "detailed_explanation": "해설", "core_concept": "개념" } ] }"""
-    return json.loads(groq.chat.completions.create(model="meta-llama/llama-4-scout-17b-16e-instruct", messages=[{"role": "user", "content": [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_encoded_jpeg}"}}]}], temperature=0.1, max_tokens=2048, response_format={"type": "json_object"}).choices[0].message.content)
+    return json.loads(llm.create(INTERACTIVE, allow_fallback=False, model="meta-llama/llama-4-scout-17b-16e-instruct", messages=[{"role": "user", "content": [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_encoded_jpeg}"}}]}], temperature=0.1, max_tokens=2048, response_format={"type": "json_object"}).choices[0].message.content)
 
 def generate_and_grade_similar(core_concept, count):
-    return groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": f"핵심 개념 '{core_concept}'에 대한 객관식/단답형 문제 {count}개를 내고 정답도 알려줘."}]).choices[0].message.content
+    return format_problems(get_problem_bank().take({core_concept: count}))
 
 def generate_review_quiz(concepts):
-    """오답 노트를 기반으로 복습 퀴즈를 생성하는 AI 함수"""
-    concept_str = ", ".join(concepts)
-    prompt = f"학생이 최근 틀렸던 핵심 개념들입니다: [{concept_str}]. 이 개념들을 복습할 수 있는 객관식 또는 단답형 문제 3개를 내고, 하단에 정답과 해설을 명확히 분리해서 제공해 주세요."
-    return groq.chat.completions.create(model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.5, max_tokens=1024).choices[0].message.content
-
-def get_standardized_image(uploaded_file):
-    if uploaded_file.name.split('.')[-1].lower() == 'pdf':
-        pix = fitz.open(stream=uploaded_file.read(), filetype="pdf").load_page(0).get_pixmap(dpi=150)
-        return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-    img = Image.open(uploaded_file)
-    return img.convert('RGB') if img.mode != 'RGB' else img
+    """오답 노트를 기반으로 복습 퀴즈를 생성하는 AI 함수 (개념별 문제 은행에서 3문제를 고루 뽑는다)"""
+    counts = Counter(concepts[i % len(concepts)] for i in range(3))
+    return format_problems(get_problem_bank().take(dict(counts)))
+
+def generate_problem_batch(core_concept, count, priority=NORMAL):
+    prompt = f"""핵심 개념 '{core_concept}'에 대한 객관식/단답형 문제 {count}개를 내고 정답과 짧은 해설도 알려줘. 반드시 아래 JSON 형식으로만 응답해: {{ "problems": [ {{ "question": "문제", "answer": "정답", "explanation": "해설" }} ] }}"""
+    content = llm.create(priority, model="llama-3.3-70b-versatile", messages=[{"role": "user", "content": prompt}], temperature=0.7, max_tokens=2048, response_format={"type": "json_object"}).choices[0].message.content
+    return [p for p in json.loads(content).get('problems', []) if p.get('question')]
+
+def format_problems(problems):
+    """문제를 먼저, 정답과 해설은 하단에 분리해서 보여준다."""
+    body = "\n\n".join(f"**문제 {i}.** {p['question']}" for i, p in enumerate(problems, 1))
+    answers = "\n".join(f"{i}. **{p.get('answer', '')}** — {p.get('explanation', '')}" for i, p in enumerate(problems, 1))
+    return f"{body}\n\n---\n**✅ 정답 및 해설**\n\n{answers}"
+
+# [추가] 업로드 이미지 내용 해시 캐시: 같은 파일은 한 번만 디코딩/전처리/인코딩/업로드/채점한다.
+# 원본은 보관하지 않고, 크기를 줄인 채점용 이미지와 표시용 썸네일만 보관한다.
+IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+class ImageEntry:
+    def __init__(self, digest, image, thumbnail):
+        self.digest, self.image, self.thumbnail = digest, image, thumbnail
+        self.jpeg, self.thumbnail_jpeg, self.analysis = None, None, None
+        self.urls = {}  # user_id -> 저장소 공개 URL (저장 경로가 사용자별이므로)
+
+    @property
+    def nbytes(self):
+        pixels = sum(img.width * img.height * len(img.getbands()) for img in (self.image, self.thumbnail))
+        return pixels + len(self.jpeg or b"") + len(self.thumbnail_jpeg or b"")
+
+class ImageCache:
+    """sha256 → ImageEntry LRU. 디코딩된 이미지와 JPEG 바이트의 총합이 max_bytes를 넘으면 오래된 것부터 버린다."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes, self.entries, self.sizes = max_bytes, OrderedDict(), {}
+        self.lock = threading.Lock()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None: self.entries.move_to_end(digest)
+            return entry
+
+    def put(self, entry):
+        with self.lock:
+            self.entries[entry.digest] = entry
+            self.entries.move_to_end(entry.digest)
+            self._resize(entry)
+        return entry
+
+    def resize(self, entry):
+        """JPEG 등 크기가 바뀐 뒤 호출해 용량 한도를 다시 맞춘다."""
+        with self.lock:
+            if entry.digest in self.entries: self._resize(entry)
+
+    def _resize(self, entry):
+        self.sizes[entry.digest] = entry.nbytes
+        while sum(self.sizes.values()) > self.max_bytes and len(self.entries) > 1:
+            digest, _ = self.entries.popitem(last=False)
+            self.sizes.pop(digest, None)
+
+@st.cache_resource
+def get_image_cache():
+    return ImageCache(IMAGE_CACHE_MAX_BYTES)
+
+# [추가] PDF 렌더링/사진 디코딩/축소는 전용 스레드 풀에서 여러 쪽을 동시에 돌린다 (Pillow 의 축소/인코딩은 GIL 을 놓는다).
+# 프로세스 풀은 쓰지 않는다: 스레드가 많은 서버 프로세스를 fork 하면 작업자가 락에 걸려 멈출 수 있고,
+# Streamlit 이 __main__ 을 app.py 로 바꿔 두므로 spawn/forkserver 작업자는 앱 스크립트를 다시 실행해 버린다.
+BATCH_MAX_PAGES = 20  # 한 번에 채점하는 최대 쪽 수 (사진 1장 = 1쪽)
+RENDER_WORKERS = 2
+
+@st.cache_resource
+def get_render_pool():
+    return ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+
+def get_page_entries(uploaded_files, worksheet=False):
+    """업로드 파일들을 쪽 단위 [(제목, ImageEntry)] 로 펼친다 (PDF 는 모든 쪽). ([(제목, ImageEntry)], 전체 쪽 수)를 돌려준다.
+
+    캐시에 없는 쪽만 렌더링하며, PDF 는 RENDER_WORKERS 개로 나눠 동시에 렌더링한다. 작업이 하나뿐이면 풀을 거치지 않는다.
+    파일별 해시와 쪽 수는 세션에 file_id 로 기억해 두므로, 다시 실행될 때는 파일을 읽지 않는다 (렌더링할 쪽이 있을 때만 읽는다).
+    """
+    cache, pages, jobs, total = get_image_cache(), [], [], 0
+    known, current = st.session_state.get('upload_pages', {}), {}
+    for uploaded_file in uploaded_files:
+        is_pdf = uploaded_file.name.split('.')[-1].lower() == 'pdf'
+        if uploaded_file.file_id not in known:
+            data = uploaded_file.getvalue()
+            known[uploaded_file.file_id] = (hashlib.sha256(data).hexdigest(), imaging.pdf_page_count(data) if is_pdf else 1)
+        digest, count = current[uploaded_file.file_id] = known[uploaded_file.file_id]
+        total += count
+        missing = []
+        for index in range(min(count, BATCH_MAX_PAGES - len(pages))):
+            # 문제지 보정 여부에 따라 채점 이미지가 달라지므로 캐시 키(=저장 경로)도 구분한다. 첫 쪽은 한 장짜리 업로드와 같은 키를 쓴다.
+            key = (digest if index == 0 else f"{digest}-p{index + 1}") + ("-ws" if worksheet else "")
+            pages.append((f"{uploaded_file.name} ({index + 1}/{count}쪽)" if count > 1 else uploaded_file.name, cache.get(key)))
+            if pages[-1][1] is None: missing.append((len(pages) - 1, index, key))
+        if not missing: continue
+        data = uploaded_file.getvalue()
+        if not is_pdf: jobs.append((data, None, missing))
+        else: jobs += [(data, [index for _, index, _ in chunk], chunk) for chunk in (missing[i::RENDER_WORKERS] for i in range(RENDER_WORKERS)) if chunk]
+    if jobs:
+        with tracer.span("image.render", pages=sum(len(slots) for *_, slots in jobs), jobs=len(jobs)):
+            if len(jobs) == 1: rendered = [imaging.render_pages(jobs[0][0], jobs[0][1], worksheet)]
+            else: rendered = [f.result() for f in [get_render_pool().submit(imaging.render_pages, data, pdf_pages, worksheet) for data, pdf_pages, _ in jobs]]
+        for (_, _, slots), results in zip(jobs, rendered):
+            for (slot, _, key), (image, thumbnail) in zip(slots, results):
+                pages[slot] = (pages[slot][0], cache.put(ImageEntry(key, image, thumbnail)))
+    st.session_state['upload_pages'] = current # 지금 올라와 있는 파일만 남긴다
+    return pages, total
+
+# ---------------------------------------------------------
+# 3-1. 사진 채점 파이프라인 (병렬 실행)
+# ---------------------------------------------------------
+# 쪽마다 인코딩·업로드·비전 채점을 하고, 여러 쪽은 서로 독립이므로 동시에 실행한다.
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="grading")
+
+class StagePipeline:
+    """공유 스레드 풀에서 단계를 실행하고 단계별 소요 시간(초)을 기록한다.
+
+    다른 단계를 기다리며 풀 스레드를 막지 않도록, 뒤 단계는 when_all 로 앞 단계가 끝날 때 제출한다.
+    """
+
+    def __init__(self, executor):
+        self.executor, self.futures, self.timings = executor, {}, {}
+        self.started = time.perf_counter()
+        self.context = contextvars.copy_context()  # 작업 스레드/완료 콜백에서 제출해도 파이프라인을 만든 rerun 의 계측 태그가 유지되도록
+
+    def _timed(self, stage, fn, *args):
+        with tracer.span(f"pipeline.{stage}"):
+            start = time.perf_counter()
+            try: return fn(*args)
+            finally: self.timings[stage] = round(time.perf_counter() - start, 3)
+
+    def submit(self, stage, fn, *args):
+        self.futures[stage] = self.executor.submit(self.context.copy().run, self._timed, stage, fn, *args)
+        return self.futures[stage]
+
+    @staticmethod
+    def when_all(futures, callback):
+        """futures 가 모두 끝나면 마지막으로 끝난 쪽의 스레드에서 callback(futures) 를 한 번 부른다."""
+        pending, lock = [len(futures)], threading.Lock()
+        def done(_):
+            with lock:
+                pending[0] -= 1
+                if pending[0]: return
+            callback(futures)
+        for future in futures: future.add_done_callback(done)
+
+    def finish(self):
+        self.timings["total"] = round(time.perf_counter() - self.started, 3)
+        return self.timings
+
+def encode_jpeg(entry):
+    if entry.jpeg is None:
+        with tracer.span("image.encode") as span:
+            entry.jpeg, span["quality"] = imaging.encode_to_budget(entry.image)
+            entry.thumbnail_jpeg = imaging.encode_jpeg(entry.thumbnail, 80)
+            span["bytes"] = len(entry.jpeg)
+        get_image_cache().resize(entry)
+    return entry.jpeg
+
+def problem_image_path(user_id, entry):
+    return f"{user_id}/{entry.digest}.jpg"
+
+def load_stored_grading(user_id, entry):
+    """캐시에서 밀려났거나 재시작된 경우, 같은 내용의 이미지에 대한 기존 저장소 객체와 채점 결과를 logs에서 찾아 복원한다."""
+    img_url = supabase.storage.from_("problem_images").get_public_url(problem_image_path(user_id, entry))
+    res = supabase.table("logs").select("answer").eq("user_id", user_id).eq("image_url", img_url).eq("log_type", "Vision").order("id", desc=True).limit(1).execute() # logs_vision_image_url_idx
+    if not res.data: return False
+    entry.urls[user_id] = img_url
+    if entry.analysis is None:
+        try: entry.analysis = json.loads(res.data[0]['answer'])
+        except (TypeError, ValueError): pass
+    return True
+
+def upload_problem_image(user_id, entry):
+    if user_id not in entry.urls:
+        file_path = problem_image_path(user_id, entry)
+        bucket = supabase.storage.from_("problem_images")
+        bucket.upload(file_path, entry.jpeg, {"content-type": "image/jpeg", "upsert": "true"})
+        bucket.upload(file_path.replace(".jpg", "_thumb.jpg"), entry.thumbnail_jpeg, {"content-type": "image/jpeg", "upsert": "true"})
+        entry.urls[user_id] = bucket.get_public_url(file_path)
+    return entry.urls[user_id]
+
+def grade_image(entry):
+    if entry.analysis is None: entry.analysis = analyze_vision_json(base64.b64encode(entry.jpeg).decode('utf-8'))
+    return entry.analysis
+
+def prepare_page(user_id, entry):
+    encode_jpeg(entry)
+    if entry.analysis is None or user_id not in entry.urls: load_stored_grading(user_id, entry)
+
+def number_results(analysis_data, page_label=None):
+    """문항 번호를 채운 사본. 여러 쪽을 묶어 채점하면 쪽 번호를 앞에 붙여 묶음 안에서 번호가 겹치지 않게 한다."""
+    results = []
+    for idx, item in enumerate(analysis_data.get('results', [])):
+        number = str(item.get('question_number') or f'{idx+1}번')
+        results.append({**item, 'question_number': f"{page_label} {number}" if page_label else number})
+    return {**analysis_data, 'results': results}
+
+# [추가] 묶음 채점: 쪽마다 인코딩·저장 결과 조회 뒤 업로드와 비전 채점을 동시에 돌리고, 쪽은 최대 BATCH_VISION_CONCURRENCY 개씩
+# 진행한다(하나 끝나면 다음 쪽 투입). 모든 쪽이 끝나면 Vision 로그(쪽마다 1개, insert 1회)+문항 결과(insert 1회)와
+# EXP(합산 1회)를 동시에 기록한다.
+BATCH_VISION_CONCURRENCY = 4
+
+class BatchGrading:
+    def __init__(self, user_id, pages):
+        self.user_id, self.pages = user_id, pages  # [(제목, ImageEntry)]
+        self.pipe = StagePipeline(get_executor())
+        self.outcomes = [Future() for _ in pages]  # 쪽별 (채점 결과, 이미지 URL)
+        self.recorded = Future()                    # (과목, EXP 반영 결과)
+        self.lock, self.next_page, self.remaining = threading.Lock(), 0, len(pages)
+        self.exp_shown = False
+        for _ in range(min(BATCH_VISION_CONCURRENCY, len(pages))): self._start_next()
+
+    def page_label(self, index):
+        return f"{index + 1}쪽" if len(self.pages) > 1 else None
+
+    @property
+    def subject(self):
+        return self.recorded.result()[0] if self.recorded.done() and not self.recorded.exception() else "기타"
+
+    def _start_next(self):
+        with self.lock:
+            if self.next_page >= len(self.pages): return
+            index, self.next_page = self.next_page, self.next_page + 1
+        self.pipe.submit(f"page{index + 1}", prepare_page, self.user_id, self.pages[index][1]).add_done_callback(lambda f: self._grade(index, f))
+
+    def _grade(self, index, prepared):
+        if prepared.exception(): return self._page_done(index, [prepared])
+        entry = self.pages[index][1]
+        vision = self.pipe.submit(f"vision{index + 1}", grade_image, entry)
+        upload = self.pipe.submit(f"upload{index + 1}", upload_problem_image, self.user_id, entry)
+        self.pipe.when_all([vision, upload], lambda futures: self._page_done(index, futures))
+
+    def _page_done(self, index, futures):
+        """futures 의 결과(실패면 첫 예외)를 쪽 결과 (채점 결과, 이미지 URL)로 남기고, 다음 쪽/마지막이면 기록 단계를 잇는다."""
+        error = next((f.exception() for f in futures if f.exception()), None)
+        if error: self.outcomes[index].set_exception(error)
+        else: self.outcomes[index].set_result(tuple(f.result() for f in futures))
+        self._start_next()
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last: self._record()
+
+    def _record(self):
+        graded = [(index, *outcome.result()) for index, outcome in enumerate(self.outcomes) if not outcome.exception()]
+        if not graded:
+            self.recorded.set_exception(RuntimeError("채점된 쪽이 없습니다")); self.pipe.finish(); return
+        numbered = [number_results(analysis_data, self.page_label(index)) for index, analysis_data, _ in graded]
+        items = [item for analysis_data in numbered for item in analysis_data['results']]
+        # 경험치 보상 계산: 쪽마다 기본 20 + 정답당 30, 묶음 전체를 한 번에 지급
+        exp = self.pipe.submit("exp", apply_exp, self.user_id, 20 * len(graded) + 30 * sum(1 for item in items if item.get('is_correct')))
+        log = self.pipe.submit("log", self.record_logs, graded, numbered)
+        self.pipe.when_all([log, exp], self._recorded)
+
+    def _recorded(self, futures):
+        error = next((f.exception() for f in futures if f.exception()), None)
+        if error: self.recorded.set_exception(error)
+        else: self.recorded.set_result(tuple(f.result() for f in futures))
+        self.pipe.finish()
+
+    def record_logs(self, graded, numbered):
+        """쪽마다 Vision 로그 1개(원본 채점 결과)와 쪽 번호를 붙인 문항 결과를 각각 insert 한 번으로 남긴다. 과목을 돌려준다."""
+        subject = classify_subject("이 사진 과목?")
+        logs = supabase.table("logs").insert([{"user_id": self.user_id, "subject": subject, "question": f"사진 채점 ({self.page_label(index)})" if len(self.pages) > 1 else "사진 채점 (다중)",
+                                               "answer": json.dumps(analysis_data, ensure_ascii=False), "image_url": img_url, "log_type": "Vision"} for index, analysis_data, img_url in graded]).execute().data or []
+        for store in list_log_stores(self.user_id): store.merge(logs)
+        add_grading_results(self.user_id, [row for log, analysis_data in zip(logs, numbered) for row in grading_rows(self.user_id, log['id'], subject, analysis_data)])
+        get_problem_bank().prefetch(item.get('core_concept') for analysis_data in numbered for item in analysis_data['results'])
+        return subject
+
+# ---------------------------------------------------------
+# 3-2. 개념별 연습 문제 은행
+# ---------------------------------------------------------
+# 채점 결과에 새 핵심 개념이 나오면 백그라운드에서 미리 문제를 만들어 두고, 버튼 클릭 시에는 꺼내 주기만 한다.
+# 재고가 부족할 때만 동기 생성하며, 꺼낸 뒤 재고가 낮으면 다시 백그라운드로 보충한다.
+PROBLEM_BANK_TARGET = 6             # 개념별로 채워 둘 문제 수
+PROBLEM_BANK_LOW = 3                # 이 아래로 떨어지면 보충
+PROBLEM_BANK_TTL = 24 * 60 * 60     # 초. 오래된 문제는 버리고 새로 만든다
+PROBLEM_BANK_MAX_CONCEPTS = 500     # 개념 수 상한 (가장 오래 안 쓰인 개념부터 제거)
+PROBLEM_BANK_RETRY_SECONDS = 60     # 백그라운드 보충이 실패한 개념은 이 시간 동안 다시 시도하지 않는다
+
+class ProblemBank:
+    def __init__(self):
+        self.entries = OrderedDict()  # concept -> {"problems": [...], "expires": 만료 시각}
+        self.filling = set()
+        self.retry_at = {}  # concept -> 보충을 다시 시도해도 되는 시각 (실패한 개념만)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="problem-bank")
+
+    def _stock(self, concept):
+        """lock 안에서 호출. 만료된 재고는 비우고, LRU 순서를 갱신한다."""
+        entry = self.entries.get(concept)
+        if entry is None or entry["expires"] < time.time():
+            entry = self.entries[concept] = {"problems": [], "expires": time.time() + PROBLEM_BANK_TTL}
+        self.entries.move_to_end(concept)
+        while len(self.entries) > PROBLEM_BANK_MAX_CONCEPTS: self.entries.popitem(last=False)
+        return entry["problems"]
+
+    def _add(self, concept, problems):
+        with self.lock: self._stock(concept).extend(problems)
+
+    def _fill(self, concept):
+        try:
+            with self.lock: missing = PROBLEM_BANK_TARGET - len(self._stock(concept))
+            if missing > 0: self._add(concept, generate_problem_batch(concept, missing, BACKGROUND))
+            with self.lock: self.retry_at.pop(concept, None)
+        except Exception: # 실패하면 잠시 쉬었다가 다음 요청 때 다시 시도 (실행마다 새 요청을 쏘지 않도록)
+            with self.lock: self.retry_at[concept] = time.time() + PROBLEM_BANK_RETRY_SECONDS
+        finally:
+            with self.lock: self.filling.discard(concept)
+
+    def prefetch(self, concepts):
+        for concept in {str(c).strip() for c in concepts if c and str(c).strip()}:
+            with self.lock:
+                if concept in self.filling or self.retry_at.get(concept, 0) > time.time() or len(self._stock(concept)) >= PROBLEM_BANK_LOW: continue
+                self.filling.add(concept)
+            self.executor.submit(self._fill, concept)
+
+    def take(self, counts):
+        """{개념: 개수}만큼 문제를 꺼낸다. 재고가 모자란 개념은 모자란 만큼만 즉시 생성하고, 재고 보충은 prefetch 에 맡긴다."""
+        counts = {str(c).strip() or "기타": n for c, n in counts.items()}
+        with self.lock: missing = {c: n - len(self._stock(c)) for c, n in counts.items() if len(self._stock(c)) < n}
+        futures = {c: get_executor().submit(generate_problem_batch, c, n, INTERACTIVE) for c, n in missing.items()}
+        for concept, future in futures.items(): self._add(concept, future.result())
+        problems = []
+        with self.lock:
+            for concept, n in counts.items():
+                stock = self._stock(concept)
+                problems += stock[:n]
+                del stock[:n]
+        self.prefetch(counts)
+        return problems
+
+@st.cache_resource
+def get_problem_bank():
+    return ProblemBank()
 
 # ---------------------------------------------------------
 # 4. 팝업(Dialog) UI 설계
 # ---------------------------------------------------------
 @st.dialog("🧠 AI 과목별 취약점 리포트", width="large")
-def ai_report_dialog(recent_logs):
-    with st.spinner("최근 학습 데이터를 기반으로 AI가 취약점을 분석 중입니다..."):
-        analysis_text = analyze_vulnerabilities(recent_logs)
-        st.markdown(analysis_text)
+def ai_report_dialog(user_id, rollups):
+    with st.spinner("누적 학습 데이터를 기반으로 AI가 취약점을 분석 중입니다..."):
+        try:
+            report = get_ai_report(user_id, "vulnerability", rollups, analyze_vulnerabilities)
+            st.markdown(report["report"])
+            generated_at = datetime.datetime.fromisoformat(report["generated_at"]).astimezone(KST)
+            st.caption(f"📅 {generated_at:%m/%d %H:%M} 기준 분석 · 새 학습 기록이 {REPORT_MIN_NEW_EVIDENCE}개 이상 쌓이면 다시 분석합니다.")
+        except Exception as e: st.markdown(f"⚠️ 분석 실패: {e}")
     st.divider()
     if st.button("닫기", use_container_width=True): st.rerun()
 
@@ -158,13 +971,30 @@ def qa_detail_dialog(log_id, q, a, is_bm):
         toggle_bookmark(log_id, is_bm); st.rerun()
 
 @st.dialog("🎯 다중 문제 채점 결과", width="large")
-def grading_dialog(analysis_data, user_id, subject, img_url):
-    st.image(st.session_state.current_img_obj, use_container_width=True)
+def grading_dialog(batch, user_id):
     has_permission = get_user_info(user_id).get('detail_permission', False)
     if "sim_problems_cache" not in st.session_state: st.session_state.sim_problems_cache = {}
+    # 쪽 순서대로 자리를 잡아 두고, 채점이 끝나는 쪽부터 채운다
+    slots = [st.container() for _ in batch.pages]
+    pending = {outcome: index for index, outcome in enumerate(batch.outcomes)}
+    with st.spinner(f"AI 비전 모델이 {len(batch.pages)}쪽을 채점 중입니다..."):
+        for outcome in as_completed(pending):
+            with slots[pending[outcome]]: render_page_results(batch, pending[outcome], user_id, has_permission)
+    try: _, exp_result = batch.recorded.result()
+    except Exception as e: st.error(f"채점 기록 저장 실패: {e}")
+    else:
+        if not batch.exp_shown: batch.exp_shown = True; show_exp_result(exp_result)
+    flush_exp() # 다이얼로그 안의 버튼은 다이얼로그만 다시 실행하므로 여기서 반영
 
-    for idx, item in enumerate(analysis_data.get('results', [])):
-        q_num = item.get('question_number', f'{idx+1}번 문제')
+def render_page_results(batch, page, user_id, has_permission):
+    title, entry = batch.pages[page]
+    if len(batch.pages) > 1: st.markdown(f"#### 📄 {batch.page_label(page)} · {title}")
+    st.image(entry.thumbnail, use_container_width=True)
+    try: analysis_data, _ = batch.outcomes[page].result()
+    except Exception as e: st.error(f"❌ 이 쪽은 채점하지 못했습니다: {e}"); st.divider(); return
+
+    for idx, item in enumerate(number_results(analysis_data, batch.page_label(page)).get('results', [])):
+        q_num = item['question_number']
         st.subheader(f"📌 {q_num}")
         if item.get('is_correct', False): st.success(f"✅ {item.get('status_text', '정답!')}")
         else: st.error(f"❌ {item.get('status_text', '오답.')}")
@@ -174,18 +1004,18 @@ def grading_dialog(analysis_data, user_id, subject, img_url):
         else: st.warning("🔒 해설 자세히 보기 (학부모 허용 필요)")
 
         c1, c2 = st.columns(2)
-        btn1, btn3 = f"sim_1_{idx}", f"sim_3_{idx}"
-        if c1.button("유사 문제 1개 풀기 (+10 EXP)", key=f"btn_1_{idx}"):
+        btn1, btn3 = f"sim_1_{page}_{idx}", f"sim_3_{page}_{idx}"
+        if c1.button("유사 문제 1개 풀기 (+10 EXP)", key=f"btn_1_{page}_{idx}"):
             with st.spinner("생성 중..."):
                 probs = generate_and_grade_similar(item.get('core_concept', ''), 1)
                 st.session_state.sim_problems_cache[btn1] = probs
-                add_log(user_id, subject, f"{q_num} 유사문제 1개", probs, log_type="Similar_Task")
+                add_log(user_id, batch.subject, f"{q_num} 유사문제 1개", probs, log_type="Similar_Task")
                 add_exp(user_id, 10) # 경험치 보상
-        if c2.button("유사 문제 3개 풀기 (+30 EXP)", key=f"btn_3_{idx}"):
+        if c2.button("유사 문제 3개 풀기 (+30 EXP)", key=f"btn_3_{page}_{idx}"):
             with st.spinner("생성 중..."):
                 probs = generate_and_grade_similar(item.get('core_concept', ''), 3)
                 st.session_state.sim_problems_cache[btn3] = probs
-                add_log(user_id, subject, f"{q_num} 유사문제 3개", probs, log_type="Similar_Task")
+                add_log(user_id, batch.subject, f"{q_num} 유사문제 3개", probs, log_type="Similar_Task")
                 add_exp(user_id, 30) # 경험치 보상
 
         if btn1 in st.session_state.sim_problems_cache: st.info(st.session_state.sim_problems_cache[btn1])
@@ -203,6 +1033,8 @@ def review_quiz_dialog(concepts):
 # ---------------------------------------------------------
 # 5. 학생 화면
 # ---------------------------------------------------------
+CHAT_WINDOW = 20                       # 채팅창에 그리는 최근 대화 턴 수 (더 보기 한 번에 같은 수만큼 늘어난다)
+
 def student_page():
     user = st.session_state['user']
     status = user.get('status', 'studying')
@@ -211,12 +1043,11 @@ def student_page():
     exp_needed = user_level * 100
     progress_val = min(user_exp / exp_needed, 1.0)
     
-    logs = get_logs(user['user_id'])
-    bm_dict = {row['id']: row['is_bookmarked'] for _, row in logs.iterrows()} if not logs.empty else {}
+    live = follow_live_changes([user['user_id']]) # 학부모가 바꾼 상태/권한은 실시간으로 반영된다
 
     t1, t2 = st.columns([9, 1])
     with t2:
-        if st.button("🔄 새로고침", use_container_width=True): st.session_state['user']=get_user_info(user['user_id']); st.rerun()
+        if not live and st.button("🔄 새로고침", use_container_width=True): st.session_state['user']=get_user_info(user['user_id']); st.rerun()
 
     left_col, center_col, right_col = st.columns([2.5, 5, 2.5])
 
@@ -232,18 +1063,12 @@ def student_page():
 
             # [추가] 나의 오답 노트 기능
             st.markdown("<div class='card'><div class='section-title'>📚 나의 오답 노트</div>", unsafe_allow_html=True)
-            wrong_concepts = []
-            if not logs.empty:
-                vision_logs = logs[logs['log_type'] == 'Vision']
-                for _, row in vision_logs.head(10).iterrows():
-                    try:
-                        data = json.loads(row['answer'])
-                        for res in data.get('results', []):
-                            if not res.get('is_correct'):
-                                concept = res.get('core_concept', '기타')
-                                wrong_concepts.append(concept)
-                                st.markdown(f"❌ <span style='font-size:13px'>{concept}</span>", unsafe_allow_html=True)
-                    except: pass
+            grades = get_grading_index(user['user_id'])
+            recent_grades = grades[grades['log_id'].isin(grades['log_id'].drop_duplicates().head(10))]
+            wrong_concepts = recent_grades.loc[~recent_grades['is_correct'], 'core_concept'].tolist()
+            for concept in wrong_concepts:
+                st.markdown(f"❌ <span style='font-size:13px'>{concept}</span>", unsafe_allow_html=True)
+            get_problem_bank().prefetch(wrong_concepts) # 복습 퀴즈용 문제 미리 준비
             
             if wrong_concepts:
                 st.markdown("<br>", unsafe_allow_html=True)
@@ -256,11 +1081,9 @@ def student_page():
             
             # 기존 북마크 리스트
             st.markdown("<div class='card'><div class='section-title'>🔖 북마크된 답변</div>", unsafe_allow_html=True)
-            if not logs.empty and 'is_bookmarked' in logs.columns:
-                bm_logs = logs[logs['is_bookmarked'] == True]
-                for idx, row in enumerate(bm_logs.head(5).iterrows()):
-                    if st.button(f"⭐ {str(row[1]['question'])[:15]}...", key=f"bkmk_{row[1]['id']}", type="tertiary", use_container_width=True):
-                        qa_detail_dialog(row[1]['id'], row[1]['question'], row[1]['answer'], True)
+            for row in recent_logs(user['user_id'], 5, BookmarkStore):
+                if st.button(f"⭐ {str(row['question'])[:15]}...", key=f"bkmk_{row['id']}", type="tertiary", use_container_width=True):
+                    qa_detail_dialog(row['id'], row['question'], row['answer'], True)
             st.markdown("</div>", unsafe_allow_html=True)
 
     # 2️⃣ 중앙: 채팅 패널
@@ -269,65 +1092,63 @@ def student_page():
         else: st.markdown('<div class="status-badge break-mode">🍀 쉬는 시간: 자유 대화 모드</div>', unsafe_allow_html=True)
         
         chat_container = st.container(height=650, border=True) 
-        if "messages" not in st.session_state: st.session_state.messages = []
+        # [추가] 대화 기록은 logs 에서 다시 만든다 (로그아웃 후에도 유지). 최근 CHAT_WINDOW 턴만 그리고, 이전 대화는 페이지 단위로 불러온다
+        window = st.session_state.setdefault('chat_window', CHAT_WINDOW)
+        turns = recent_logs(user['user_id'], window + 1, ChatStore)
         
         with chat_container:
-            for msg in st.session_state.messages:
-                with st.chat_message(msg["role"]): 
-                    st.markdown(msg["content"])
-                    if msg["role"] == "assistant" and msg.get("log_id"):
-                        log_id = msg["log_id"]
-                        is_bm = bm_dict.get(log_id, False)
-                        if st.button("⭐ 북마크 해제" if is_bm else "☆ 북마크 하기", key=f"chat_bm_{log_id}"):
-                            toggle_bookmark(log_id, is_bm); st.rerun()
+            if len(turns) > window and st.button("⬆️ 이전 대화 더 보기", key="chat_older", type="tertiary", use_container_width=True):
+                st.session_state.chat_window += CHAT_WINDOW; st.rerun()
+            for turn in reversed(turns[:window]):
+                with st.chat_message("user"): st.markdown(turn['question'])
+                with st.chat_message("assistant"): 
+                    st.markdown(f"**[{turn['subject']} 튜터]**\n{turn['answer']}")
+                    is_bm = bool(turn['is_bookmarked']) # 로그 캐시(id 색인)의 값. toggle_bookmark 가 바로 갱신한다
+                    if st.button("⭐ 북마크 해제" if is_bm else "☆ 북마크 하기", key=f"chat_bm_{turn['id']}"):
+                        toggle_bookmark(turn['id'], is_bm); st.rerun()
 
         if prompt := st.chat_input("공부하다 궁금한 점을 물어보세요! (+10 EXP)"):
-            st.session_state.messages.append({"role": "user", "content": prompt}); st.rerun()
+            st.session_state.pending_prompt = prompt; st.rerun()
 
-        if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-            prompt = st.session_state.messages[-1]["content"]
+        if prompt := st.session_state.get('pending_prompt'):
             with chat_container:
+                with st.chat_message("user"): st.markdown(prompt)
                 with st.chat_message("assistant"):
                     with st.spinner("AI가 생각 중입니다..."):
                         auto_subject = classify_subject(prompt)
-                        response, log_type = get_text_response(status, auto_subject, prompt)
-                        st.markdown(f"**[{auto_subject} 튜터]**\n{response}")
-                        res = add_log(user['user_id'], auto_subject, prompt, response, log_type=log_type)
-                        new_log_id = res.data[0]['id'] if res.data else None
-                        add_exp(user['user_id'], 10) # 질문 완료시 경험치
-            st.session_state.messages.append({"role": "assistant", "content": f"**[{auto_subject} 튜터]**\n{response}", "log_id": new_log_id}); st.rerun()
+                        stream = stream_text_response(status, auto_subject, prompt)
+                    st.markdown(f"**[{auto_subject} 튜터]**")
+                    st.write_stream(stream)
+                    # 스트림이 끝난 뒤에만 저장/경험치 지급
+                    response = stream.text
+                    add_log(user['user_id'], auto_subject, prompt, response, log_type=stream.log_type) # 로그 캐시에 바로 반영되어 다음 실행의 대화 기록이 된다
+                    add_exp(user['user_id'], 10) # 질문 완료시 경험치
+            del st.session_state.pending_prompt; st.rerun()
 
     # 3️⃣ 오른쪽: 사진 업로드 패널
     with right_col:
         with st.container(height=800, border=False):
             st.markdown("<div class='card' style='text-align:center;'><b>📷 문제 사진 업로드</b><br><span style='font-size:12px;color:gray'>정답 맞히면 보너스 EXP 지급!</span></div>", unsafe_allow_html=True)
-            uploaded_file = st.file_uploader("", type=['jpg', 'jpeg', 'png', 'pdf', 'heic', 'heif'], label_visibility="collapsed")
-            if uploaded_file:
+            uploaded_files = st.file_uploader("", type=['jpg', 'jpeg', 'png', 'pdf', 'heic', 'heif'], accept_multiple_files=True, label_visibility="collapsed")
+            # 다이얼로그가 닫혀 중간에 끊긴 묶음 채점도 백그라운드에서 끝까지 기록되므로, 레벨업 결과는 여기서 한 번 보여 준다
+            batch = st.session_state.get('grading_batch')
+            if batch and not batch.exp_shown and batch.recorded.done() and not batch.recorded.exception():
+                batch.exp_shown = True; show_exp_result(batch.recorded.result()[1])
+            if uploaded_files:
                 try:
-                    standard_img = get_standardized_image(uploaded_file)
-                    st.session_state.current_img_obj = standard_img
-                    st.image(standard_img, use_container_width=True)
-                    if st.button("✅ 사진 채점 및 분석 시작 (+20 EXP)", use_container_width=True, type="primary"):
+                    worksheet_mode = st.toggle("📄 문제지 보정 (흑백·대비)", help="종이 문제지 사진의 그림자와 누런 배경을 걷어내 채점 정확도를 높입니다.")
+                    pages, total_pages = get_page_entries(uploaded_files, worksheet_mode)
+                    if len(pages) == 1: st.image(pages[0][1].thumbnail, use_container_width=True)
+                    else: st.image([entry.thumbnail for _, entry in pages], caption=[f"{i}쪽" for i in range(1, len(pages) + 1)], width=110)
+                    if total_pages > len(pages): st.caption(f"⚠️ 한 번에 {BATCH_MAX_PAGES}쪽까지만 채점합니다. (전체 {total_pages}쪽)")
+                    if st.button(f"✅ 사진 채점 및 분석 시작 (+{20 * len(pages)} EXP)", use_container_width=True, type="primary"):
                         if "sim_problems_cache" in st.session_state: st.session_state.sim_problems_cache.clear()
-                        with st.spinner("AI 비전 모델이 채점 중입니다..."):
-                            buffer = io.BytesIO()
-                            standard_img.save(buffer, format="JPEG", quality=85)
-                            jpeg_bytes = buffer.getvalue()
-                            b64_encoded = base64.b64encode(jpeg_bytes).decode('utf-8')
-                            file_path = f"{user['user_id']}/{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                            supabase.storage.from_("problem_images").upload(file_path, jpeg_bytes)
-                            img_url = supabase.storage.from_("problem_images").get_public_url(file_path)
-                            
-                            auto_subject = classify_subject("이 사진 과목?") 
-                            analysis_data = analyze_vision_json(b64_encoded)
-                            add_log(user['user_id'], auto_subject, f"사진 채점 (다중)", json.dumps(analysis_data, ensure_ascii=False), img_url, "Vision")
-                            
-                            # 경험치 보상 계산
-                            correct_count = sum(1 for item in analysis_data.get('results', []) if item.get('is_correct'))
-                            earned_exp = 20 + (correct_count * 30) # 기본 20 + 정답당 30
-                            add_exp(user['user_id'], earned_exp)
-                            
-                            grading_dialog(analysis_data, user['user_id'], auto_subject, img_url)
+                        st.session_state.grading_batch = BatchGrading(user['user_id'], pages)
+                        st.session_state.last_grading_timings = st.session_state.grading_batch.pipe.timings
+                        grading_dialog(st.session_state.grading_batch, user['user_id'])
+                    if "last_grading_timings" in st.session_state:
+                        with st.expander("⏱️ 채점 단계별 소요 시간"):
+                            st.caption(" · ".join(f"{stage} {sec:.2f}s" for stage, sec in dict(st.session_state.last_grading_timings).items()))
                 except Exception as e: st.error(f"오류: {e}")
 
 # ---------------------------------------------------------
@@ -343,6 +1164,7 @@ def parent_page():
         ctrl1, ctrl2, ctrl3, ctrl4 = st.columns([2, 3, 3, 2])
         with ctrl1: target_id = st.selectbox("자녀 선택", [u['user_id'] for u in students], label_visibility="collapsed")
         target_user = next(u for u in students if u['user_id'] == target_id)
+        live = follow_live_changes([target_id]) # 자녀의 새 학습 기록/상태 변경은 실시간으로 반영된다
         
         with ctrl2:
             if target_user['status'] == 'studying':
@@ -353,25 +1175,11 @@ def parent_page():
             perm_label = "✅ 해설 보기 끄기" if target_user.get('detail_permission', False) else "🔒 해설 보기 켜기"
             if st.button(perm_label, use_container_width=True): update_user_status(target_id, 'detail_permission', not target_user.get('detail_permission', False)); st.rerun()
         with ctrl4:
-            if st.button("🔄 화면 새로고침", use_container_width=True): st.rerun()
+            if not live and st.button("🔄 화면 새로고침", use_container_width=True): st.rerun()
             
-        logs = get_logs(target_id)
-        
-        total_q = len(logs)
-        vision_logs = logs[logs['log_type'] == 'Vision']
-        correct_cnt, total_vision = 0, 0
-        wrong_concepts = []
-        
-        for _, row in vision_logs.iterrows():
-            try:
-                data = json.loads(row['answer'])
-                for res in data.get('results', []):
-                    total_vision += 1
-                    if res.get('is_correct'): correct_cnt += 1
-                    else: wrong_concepts.append(res.get('core_concept', '알 수 없는 개념'))
-            except: pass
-            
-        accuracy = int((correct_cnt / total_vision) * 100) if total_vision > 0 else 0
+        rollups = get_daily_rollups(target_id)
+        with tracer.span("dataframe.rollup_summary", rows=len(rollups)):
+            total_q, accuracy, by_subject, wrong_counts, daily_accuracy, weekly_minutes = summarize_rollups(rollups)
         
         # 1. 지표 카드 (레벨 추가)
         st.markdown("<div class='card'>", unsafe_allow_html=True)
@@ -379,41 +1187,58 @@ def parent_page():
         with m1: st.markdown(f"<div class='metric-label'>현재 레벨</div><div class='metric-value'>Lv.{target_user.get('level', 1)}</div>", unsafe_allow_html=True)
         with m2: st.markdown(f"<div class='metric-label'>총 질문 수</div><div class='metric-value'>{total_q}건</div>", unsafe_allow_html=True)
         with m3: st.markdown(f"<div class='metric-label'>정답률</div><div class='metric-value'>{accuracy}%</div>", unsafe_allow_html=True)
-        with m4: st.markdown(f"<div class='metric-label'>주간 공부 시간</div><div class='metric-value'>6h 20m</div>", unsafe_allow_html=True)
+        with m4: st.markdown(f"<div class='metric-label'>주간 공부 시간</div><div class='metric-value'>{weekly_minutes // 60}h {weekly_minutes % 60}m</div>", unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
         # 2. 오답 경고 (Alerts)
-        if wrong_concepts:
+        if not wrong_counts.empty:
             st.markdown("<div class='section-title'>🚨 자녀가 자주 틀리는 개념</div>", unsafe_allow_html=True)
-            for concept in list(set(wrong_concepts))[:3]: 
+            for concept in wrong_counts.index[:3]: 
                 st.markdown(f"<div class='alert-bar'>⚠️ '{concept}' 개념의 복습이 시급합니다.</div>", unsafe_allow_html=True)
 
         # 3. 차트 섹션
         c1, c2 = st.columns([6, 4])
         with c1:
             st.markdown("<div class='card'><div class='section-title'>📊 주간 정답률 추이</div>", unsafe_allow_html=True)
-            dummy_line = pd.DataFrame({'일차': ['월','화','수','목','금','토'], '정답률': [75, 80, 78, 85, 90, accuracy]})
-            st.plotly_chart(px.line(dummy_line, x='일차', y='정답률', markers=True, height=220), use_container_width=True)
+            if not daily_accuracy.empty:
+                with tracer.span("render.accuracy_chart", rows=len(daily_accuracy)): st.plotly_chart(px.line(daily_accuracy, x='일자', y='정답률', markers=True, height=220), use_container_width=True)
+            else: st.info("채점 기록이 부족합니다.")
             st.markdown("</div>", unsafe_allow_html=True)
             
         with c2:
             st.markdown("<div class='card'><div class='section-title'>🥧 과목별 질문 비중</div>", unsafe_allow_html=True)
-            if not logs.empty: st.plotly_chart(px.pie(logs, names='subject', hole=0.5, height=220), use_container_width=True)
+            if not by_subject.empty:
+                with tracer.span("render.subject_pie", rows=len(by_subject)): st.plotly_chart(px.pie(names=by_subject.index, values=by_subject.values, hole=0.5, height=220), use_container_width=True)
             else: st.info("데이터가 부족합니다.")
             st.markdown("</div>", unsafe_allow_html=True)
 
         # 4. AI 리포트 팝업 호출
         st.markdown("<div class='card'><div class='section-title'>🧠 AI 과목별 취약점 진단</div>", unsafe_allow_html=True)
-        st.markdown("<span style='color:gray; font-size:14px;'>최근 15개의 학습 기록을 바탕으로 취약점을 심층 분석합니다.</span><br><br>", unsafe_allow_html=True)
+        st.markdown("<span style='color:gray; font-size:14px;'>누적 학습 기록 요약(과목별 질문, 자주 틀린 개념, 최근 정답률 추이)을 바탕으로 취약점을 심층 분석합니다.</span><br><br>", unsafe_allow_html=True)
         if st.button("✨ 팝업으로 AI 분석 리포트 열기", type="primary"):
-            recent_logs = logs[['subject', 'question']].head(15).to_dict('records')
-            ai_report_dialog(recent_logs)
+            ai_report_dialog(target_id, rollups)
         st.markdown("</div>", unsafe_allow_html=True)
 
+# [추가] 성능 패널: 이번 실행(과 st.rerun 으로 끝난 직전 실행)의 연산별 지연/페이로드/토큰 분석
+def render_perf_panel(container, rerun_ids):
+    spans = [s for rerun_id in rerun_ids if rerun_id for s in tracer.spans_for(rerun=rerun_id)]
+    with container.container():
+        st.markdown("**⏱️ 실행별 지연 분석**")
+        if spans:
+            df = pd.DataFrame(spans).reindex(columns=["rerun", "op", "ms", "bytes", "prompt_tokens", "completion_tokens"])
+            df["tokens"] = df[["prompt_tokens", "completion_tokens"]].sum(axis=1, min_count=1)
+            summary = df.groupby(["rerun", "op"], sort=False).agg(calls=("ms", "size"), total_ms=("ms", "sum"), max_ms=("ms", "max"), bytes=("bytes", "sum"), tokens=("tokens", "sum"))
+            st.dataframe(summary.sort_values("total_ms", ascending=False), use_container_width=True)
+        else: st.caption("기록된 스팬이 없습니다.")
+        st.download_button("Prometheus 텍스트 내보내기", tracer.prometheus_text(), file_name="focus_metrics.prom", use_container_width=True)
+        with st.expander("📡 AI 요청 대기열"): st.json(llm.metrics(), expanded=False)
+
 # ---------------------------------------------------------
 # 7. 메인 실행 제어
 # ---------------------------------------------------------
 if "logged_in" not in st.session_state: st.session_state['logged_in'] = False
+prev_rerun_id, st.session_state['rerun_id'] = st.session_state.get('rerun_id'), uuid.uuid4().hex[:8]
+tracer.set_tags(rerun=st.session_state['rerun_id'], user=st.session_state.get('user', {}).get('user_id'), page=st.session_state.get('user', {}).get('role', 'login'))
 if not st.session_state['logged_in']:
     st.markdown("<br><h1 style='text-align: center; color:#1f2937;'>🎓 Focus-Super-AI</h1>", unsafe_allow_html=True)
     col1, col2, col3 = st.columns([1,2,1])
@@ -431,5 +1256,7 @@ else:
     with st.sidebar:
         st.markdown(f"**👤 {st.session_state['user']['name']}님 환영합니다.**")
         if st.button("로그아웃", use_container_width=True): st.session_state.clear(); st.rerun()
-    if st.session_state['user']['role'] == 'student': student_page()
-    else: parent_page()
\ No newline at end of file
+        perf_panel = st.empty() if st.secrets.get("SHOW_PERF_PANEL") else None
+    for msg in st.session_state.pop('pending_toasts', []): st.toast(msg, icon="🏆")
+    run_page(student_page if st.session_state['user']['role'] == 'student' else parent_page)
+    if perf_panel: render_perf_panel(perf_panel, [prev_rerun_id, st.session_state['rerun_id']])
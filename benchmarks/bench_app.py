@@ -0,0 +1,235 @@
+"""학생/학부모 화면 벤치마크 (Streamlit AppTest + fakes.py 가짜 백엔드, 네트워크 불필요).
+
+로그 수(100 → 100k)에 따른 로그인 직후/이후 rerun 지연, 사진 한 장/여러 쪽 PDF 채점 전체 소요 시간, 동시 세션 N개의 채팅 응답 지연을
+재고 benchmarks/baseline.json 과 비교한다. 기준보다 tolerance 비율 + slack 밀리초 넘게 느려진 항목이 있으면 종료 코드 1.
+기준선은 측정한 기계에 묶이므로, 다른 기계에서는 먼저 --update-baseline 으로 다시 만든다.
+
+    python -m benchmarks.bench_app                      # 전체 측정 후 기준선과 비교
+    python -m benchmarks.bench_app --quick              # 로그 100/1k, 세션 1/4 만
+    python -m benchmarks.bench_app --only grading       # rerun / grading / sessions 중 일부만
+    python -m benchmarks.bench_app --update-baseline    # 이번 결과를 기준선으로 저장
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import streamlit as st
+from PIL import Image, ImageDraw
+from streamlit import config
+from streamlit.logger import set_log_level
+from streamlit.runtime.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+
+import fakes
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app.py"
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+RUN_TIMEOUT = 300
+
+# 가짜 백엔드 지연 (초). 같은 리전의 Supabase 왕복, Groq 첫 토큰/토큰 간격, 비전 채점 응답 시간 정도로 잡았다.
+SUPABASE_LATENCY = 0.015
+GROQ_FIRST_TOKEN = 0.25
+GROQ_TOKEN = 0.005
+GROQ_VISION = 1.2
+
+LOG_COUNTS = (100, 1_000, 10_000, 100_000)
+SESSION_COUNTS = (1, 4, 8)
+SESSION_LOGS = 1_000
+PACKET_PAGES = 6
+
+
+def share_runtime():
+    """AppTest 는 프로세스에 세션이 하나뿐이라고 가정한다 (실행이 끝날 때마다 런타임을 지우고, 실행마다 스크립트를 새로 컴파일).
+
+    동시 세션을 돌리기 위해 실제 서버처럼 런타임과 컴파일된 스크립트를 모든 세션이 함께 쓰게 한다.
+    """
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None: last["runtime"] = cls._instance
+        return cls._instance or last["runtime"]
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in last)
+    shared = ScriptCache()
+
+    def init(self): self._cache, self._lock = shared._cache, shared._lock
+    ScriptCache.__init__ = init
+    # 세션마다 secrets 를 갈아끼우면 동시 실행 중에 서로 덮어쓰므로 전역으로 한 번만 둔다
+    secrets = Secrets()
+    secrets._secrets = {"FAKE_SUPABASE": True, "FAKE_GROQ": True}
+    st.secrets = secrets
+
+
+def install_backends(log_count, students=1):
+    """학생 students 명에게 로그를 log_count 개씩 채운 가짜 백엔드를 끼우고, 이전 시나리오의 캐시를 비운다."""
+    db = fakes.FakeSupabase(latency=SUPABASE_LATENCY)
+    for i in range(1, students):
+        db.insert_row("users", {"user_id": f"student_{i}", "name": f"학생 {i}", "role": "student", "status": "studying",
+                                "detail_permission": False, "level": 1, "exp": 0})
+    for user_id in ["joshua"] + [f"student_{i}" for i in range(1, students)]: fakes.seed_logs(db, user_id, log_count)
+    fakes.install(db, fakes.FakeGroq(first_token_delay=GROQ_FIRST_TOKEN, token_delay=GROQ_TOKEN, vision_delay=GROQ_VISION))
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    return db
+
+
+def timed_run(at, label, action=None):
+    start = time.perf_counter()
+    (action or at.run)()
+    elapsed = (time.perf_counter() - start) * 1000
+    if at.exception: raise RuntimeError(f"{label}: {at.exception[0].message}")
+    return elapsed
+
+
+def login(user_id):
+    """로그인 버튼을 누르고 첫 화면이 다 그려질 때까지의 시간(ms)을 함께 돌려준다."""
+    at = AppTest.from_file(str(APP_PATH), default_timeout=RUN_TIMEOUT).run()
+    at.text_input[0].input(user_id)
+    at.text_input[1].input("1234")
+    at.button[0].click()
+    return at, timed_run(at, f"login {user_id}")
+
+
+def worksheet_page(variant):
+    """A4 150dpi 문제지 흉내. variant 마다 내용이 달라 이미지 캐시에 걸리지 않는다."""
+    page = Image.new("RGB", (1240, 1754), (244, 236, 214))
+    draw = ImageDraw.Draw(page)
+    for y in range(80, 1700, 40):
+        draw.text((40, y), f"{y // 40}. 다음 식을 계산하시오: {variant}x + 5 = 20,  x = ?  " * 3, fill=(30, 30, 30))
+    return page
+
+
+def worksheet_png(variant):
+    buffer = io.BytesIO()
+    worksheet_page(variant).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def worksheet_pdf(variant, pages=PACKET_PAGES):
+    """여러 쪽짜리 문제지 묶음 (PDF)."""
+    images = [worksheet_page(f"{variant}-{i}") for i in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", resolution=150, save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def bench_reruns(log_counts, reruns=5):
+    results = {}
+    for count in log_counts:
+        for user_id, page in (("joshua", "student"), ("parent_joshua", "parent")):
+            install_backends(count)
+            at, cold = login(user_id)
+            results[f"rerun.{page}.{count}.cold_ms"] = cold
+            results[f"rerun.{page}.{count}.warm_ms"] = statistics.median(timed_run(at, f"rerun {page} {count}") for _ in range(reruns))
+            print(f"  {page:<8}{count:>8} logs  cold {cold:8.0f} ms  warm {results[f'rerun.{page}.{count}.warm_ms']:8.0f} ms", flush=True)
+    return results
+
+
+def bench_grading(repeat=3):
+    install_backends(SESSION_LOGS)
+    at, _ = login("joshua")
+    uploads, grades = [], []
+    for i in range(repeat):
+        uploads.append(timed_run(at, "upload", lambda: at.file_uploader[0].set_value((f"sheet_{i}.png", worksheet_png(i), "image/png")).run()))
+        button = next(b for b in at.button if b.label.startswith("✅ 사진 채점"))
+        grades.append(timed_run(at, "grading", lambda: button.click().run()))
+    results = {"grading.upload_ms": statistics.median(uploads), "grading.e2e_ms": statistics.median(grades)}
+    print(f"  upload+preview {results['grading.upload_ms']:8.0f} ms  grading {results['grading.e2e_ms']:8.0f} ms", flush=True)
+    uploads, grades = [], []
+    for i in range(repeat):
+        uploads.append(timed_run(at, "packet upload", lambda: at.file_uploader[0].set_value((f"packet_{i}.pdf", worksheet_pdf(i), "application/pdf")).run()))
+        button = next(b for b in at.button if b.label.startswith("✅ 사진 채점"))
+        grades.append(timed_run(at, "packet grading", lambda: button.click().run()))
+    results.update({"grading.packet_upload_ms": statistics.median(uploads), "grading.packet_e2e_ms": statistics.median(grades)})
+    print(f"  {PACKET_PAGES}-page packet  upload+preview {results['grading.packet_upload_ms']:8.0f} ms  grading {results['grading.packet_e2e_ms']:8.0f} ms", flush=True)
+    return results
+
+
+def bench_sessions(session_counts, messages=3):
+    results = {}
+    for n in session_counts:
+        install_backends(SESSION_LOGS, students=n)
+        latencies, errors, lock = [], [], threading.Lock()
+
+        def session(user_id):
+            try:
+                at, _ = login(user_id)
+                for k in range(messages):
+                    elapsed = timed_run(at, f"chat {user_id}", lambda: at.chat_input[0].set_value(f"{user_id} 질문 {k}: 일차방정식 풀이").run())
+                    with lock: latencies.append(elapsed)
+            except Exception as e:
+                with lock: errors.append(f"{user_id}: {e}")
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=session, args=("joshua" if i == 0 else f"student_{i}",)) for i in range(n)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        if errors: raise RuntimeError("; ".join(errors))
+        latencies.sort()
+        results[f"sessions.{n}.chat_p50_ms"] = latencies[len(latencies) // 2]
+        results[f"sessions.{n}.chat_p95_ms"] = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        results[f"sessions.{n}.wall_ms"] = (time.perf_counter() - start) * 1000
+        print(f"  {n:>2} sessions  chat p50 {results[f'sessions.{n}.chat_p50_ms']:8.0f} ms  p95 {results[f'sessions.{n}.chat_p95_ms']:8.0f} ms", flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """(항목, 현재, 기준, 회귀 여부) 목록. 기준선에 없는 항목은 비교하지 않는다."""
+    rows = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        rows.append((key, value, base, base is not None and value > base * (1 + tolerance) + slack_ms))
+    return rows
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--only", choices=("rerun", "grading", "sessions"), action="append")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="허용 비율 (기본 30%%)")
+    parser.add_argument("--slack-ms", type=float, default=100.0, help="작은 값의 잡음을 흡수할 절대 여유")
+    args = parser.parse_args(argv)
+    config.set_option("logger.level", "error")  # AppTest 가 설정을 다시 읽을 때도 유지되도록
+    set_log_level("error")
+    share_runtime()
+
+    suites = args.only or ["rerun", "grading", "sessions"]
+    results = {}
+    if "rerun" in suites:
+        print("rerun latency")
+        results.update(bench_reruns(LOG_COUNTS[:2] if args.quick else LOG_COUNTS))
+    if "grading" in suites:
+        print("photo grading")
+        results.update(bench_grading())
+    if "sessions" in suites:
+        print("concurrent sessions")
+        results.update(bench_sessions(SESSION_COUNTS[:2] if args.quick else SESSION_COUNTS))
+    results = {k: round(v, 1) for k, v in results.items()}
+
+    stored = json.loads(BASELINE_PATH.read_text(encoding="utf-8")) if BASELINE_PATH.exists() else {"metrics": {}}
+    if args.update_baseline:
+        stored["metrics"] = {**stored["metrics"], **results}
+        BASELINE_PATH.write_text(json.dumps(stored, indent=2, ensure_ascii=False, sort_keys=True) + "\n", encoding="utf-8")
+        print(f"baseline updated: {BASELINE_PATH}")
+        return 0
+
+    rows = compare(results, stored["metrics"], args.tolerance, args.slack_ms)
+    print(f"\n{'metric':<36}{'ms':>10}{'baseline':>10}{'delta':>9}")
+    for key, value, base, regressed in rows:
+        delta = f"{(value / base - 1) * 100:+.0f}%" if base else "-"
+        print(f"{key:<36}{value:>10.0f}{base if base is not None else '-':>10}{delta:>9}{'  REGRESSION' if regressed else ''}")
+    regressions = [key for key, _, _, regressed in rows if regressed]
+    if regressions: print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%} + {args.slack_ms:.0f} ms")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,344 @@
+"""오프라인 개발/테스트용 가짜 백엔드.
+
+secrets.toml 에 `FAKE_GROQ = true` / `FAKE_SUPABASE = true` 를 넣으면 app.py 가 실제 Groq/Supabase 대신
+이 클라이언트를 쓴다. FakeSupabase 는 app.py 가 쓰는 supabase-py 표면(테이블 조회/쓰기, rpc, storage)만 흉내 낸다.
+벤치마크는 지연 시간과 시드 데이터를 정한 인스턴스를 install() 로 끼워 넣는다 (benchmarks/bench_app.py).
+FakeSupabase 의 쓰기는 FakeRealtime 으로도 흘러가므로 실시간 반영(live_updates.py)도 오프라인에서 확인할 수 있다.
+"""
+import asyncio
+import bisect
+import copy
+import datetime
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+
+def default_reply(messages, model, response_format=None):
+    """요청 내용에 맞춰 그럴듯한 고정 응답을 만든다."""
+    content = messages[-1]["content"]
+    text = content if isinstance(content, str) else " ".join(p.get("text", "") for p in content)
+    if response_format and '"problems"' in text:
+        return json.dumps({"problems": [{"question": f"가짜 연습 문제 {i + 1}", "answer": "정답", "explanation": "가짜 해설"} for i in range(int(re.search(r"문제 (\d+)개", text).group(1)))]}, ensure_ascii=False)
+    if response_format and response_format.get("type") == "json_object":
+        return json.dumps({"results": [
+            {"question_number": "1번", "is_correct": True, "status_text": "정답입니다!", "detailed_explanation": "가짜 해설", "core_concept": "일차방정식"},
+            {"question_number": "2번", "is_correct": False, "status_text": "오답입니다.", "detailed_explanation": "가짜 해설", "core_concept": "분수의 나눗셈"},
+        ]}, ensure_ascii=False)
+    if "중 딱 하나로 대답해" in text: return "수학"
+    return f"가짜 튜터 답변입니다. 질문 내용: {text[:40]}"
+
+
+class FakeGroq:
+    """groq.Groq 의 chat.completions.create 만 흉내 낸다. stream=True 면 토큰 단위 청크를 흘려보낸다.
+
+    이미지가 들어간 요청(비전 채점)은 vision_delay 만큼, 나머지 비스트림 요청은 first_token_delay 만큼 기다린다.
+    """
+
+    def __init__(self, reply=default_reply, chunk_size=4, first_token_delay=0.3, token_delay=0.02, vision_delay=None):
+        self.reply, self.chunk_size = reply, chunk_size
+        self.first_token_delay, self.token_delay = first_token_delay, token_delay
+        self.vision_delay = first_token_delay if vision_delay is None else vision_delay
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, response_format=None, **kwargs):
+        self.calls.append({"model": model, "messages": messages, "stream": stream, **kwargs})
+        text = self.reply(messages, model, response_format)
+        if stream: return self._stream(text, sum(len(m["content"]) for m in messages if isinstance(m["content"], str)) // 2)
+        has_image = any(not isinstance(m["content"], str) and any(p.get("type") == "image_url" for p in m["content"]) for m in messages)
+        time.sleep(self.vision_delay if has_image else self.first_token_delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")])
+
+    def _stream(self, text, prompt_tokens):
+        time.sleep(self.first_token_delay)
+        for i in range(0, len(text), self.chunk_size):
+            if i: time.sleep(self.token_delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + self.chunk_size]), finish_reason=None)])
+        # Groq 처럼 마지막 청크의 x_groq.usage 에 토큰 사용량을 싣는다 (출력은 청크 수로 어림)
+        completion_tokens = -(-len(text) // self.chunk_size)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")], x_groq=SimpleNamespace(usage=usage))
+
+
+def award_exp(db, p_user_id, p_amount):
+    """supabase/migrations 의 award_exp() 와 같은 규칙. 레벨업 필요 경험치 = 현재 레벨 * 100."""
+    user = next((u for u in db.tables["users"] if u["user_id"] == p_user_id), None)
+    if user is None: return None
+    level = user.get("level") or 1
+    start_level, exp = level, (user.get("exp") or 0) + p_amount
+    while exp >= level * 100:
+        exp -= level * 100
+        level += 1
+    old = dict(user)
+    user.update(level=level, exp=exp)
+    db.realtime.publish("users", "UPDATE", user, old)
+    return {"user_id": p_user_id, "level": level, "exp": exp, "levels_gained": level - start_level}
+
+
+def apply_daily_rollups(db, p_user_id, p_deltas, p_from_log_id, p_from_grade_id, p_last_log_id, p_last_grade_id, p_last_activity_at):
+    """supabase/migrations 의 apply_daily_rollups() 와 같은 규칙. 워터마크가 p_from_* 와 다르면 반영하지 않고 False."""
+    states, rollups = db.tables.setdefault("rollup_state", []), db.tables.setdefault("daily_rollups", [])
+    state = next((s for s in states if s["user_id"] == p_user_id), None) or db.insert_row("rollup_state", {"user_id": p_user_id, "last_log_id": 0, "last_grade_id": 0, "last_activity_at": None})
+    if (state["last_log_id"], state["last_grade_id"]) != (p_from_log_id, p_from_grade_id): return False
+    state.update(last_log_id=p_last_log_id, last_grade_id=p_last_grade_id, last_activity_at=p_last_activity_at)
+    for delta in p_deltas:
+        row = next((r for r in rollups if r["user_id"] == p_user_id and r["day"] == delta["day"]), None)
+        if row is None:
+            db.insert_row("daily_rollups", {"user_id": p_user_id, **copy.deepcopy(delta)}); continue
+        for key in ("graded_items", "correct_items", "active_minutes"): row[key] += delta[key]
+        for key in ("questions_by_subject", "wrong_concepts"):
+            row[key] = dict(Counter(row[key]) + Counter(delta[key]))
+    return True
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.action, self.payload, self.columns = "select", None, None
+        self.filters, self.order_by, self.row_limit, self.count = [], None, None, None
+        self.after_id = None
+
+    def select(self, columns="*", count=None):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        self.count = count
+        return self
+
+    def insert(self, payload):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def update(self, payload):
+        self.action, self.payload = "update", payload
+        return self
+
+    def upsert(self, payload, on_conflict="id"):
+        self.action, self.payload, self.on_conflict = "upsert", payload, [c.strip() for c in on_conflict.split(",")]
+        return self
+
+    def eq(self, column, value): return self._filter(lambda row: row.get(column) == value)
+    def gt(self, column, value):
+        if column == "id": self.after_id = value if self.after_id is None else max(self.after_id, value)
+        return self._filter(lambda row: row.get(column) is not None and row[column] > value)
+    def gte(self, column, value): return self._filter(lambda row: row.get(column) is not None and row[column] >= value)
+    def lt(self, column, value): return self._filter(lambda row: row.get(column) is not None and row[column] < value)
+    def in_(self, column, values): return self._filter(lambda row: row.get(column) in set(values))
+
+    def _filter(self, predicate):
+        self.filters.append(predicate)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, size):
+        self.row_limit = size
+        return self
+
+    def execute(self):
+        if self.db.latency: time.sleep(self.db.latency)
+        with self.db.lock:
+            return SimpleNamespace(data=copy.deepcopy(getattr(self, f"_{self.action}")()), count=self._count)
+
+    def _candidates(self):
+        """행은 id 가 증가하는 순서로 쌓이므로, id > n 조건은 인덱스처럼 이분 탐색으로 앞부분을 건너뛴다."""
+        rows = self.db.tables[self.table]
+        if self.after_id is None or not rows or "id" not in rows[0]: return rows
+        return rows[bisect.bisect_right(rows, self.after_id, key=lambda row: row["id"]):]
+
+    def _select(self):
+        candidates = self._candidates()
+        if self.order_by and self.order_by[0] == "id" and not self.count and candidates and "id" in candidates[0]:
+            # 이미 id 순서이므로 정렬 없이 필요한 만큼만 훑는다
+            matches = (row for row in (reversed(candidates) if self.order_by[1] else candidates) if all(f(row) for f in self.filters))
+            rows, self._count = list(itertools.islice(matches, self.row_limit)), None
+        else:
+            rows = [row for row in candidates if all(f(row) for f in self.filters)]
+            self._count = len(rows) if self.count else None
+            if self.order_by: rows.sort(key=lambda row: (row.get(self.order_by[0]) is None, row.get(self.order_by[0])), reverse=self.order_by[1])
+            if self.row_limit is not None: rows = rows[:self.row_limit]
+        return [{c: row.get(c) for c in self.columns} if self.columns else row for row in rows]
+
+    def _insert(self):
+        self._count = None
+        return [self.db.insert_row(self.table, row) for row in (self.payload if isinstance(self.payload, list) else [self.payload])]
+
+    def _update(self):
+        self._count = None
+        rows = [row for row in self.db.tables[self.table] if all(f(row) for f in self.filters)]
+        for row in rows:
+            old = dict(row)
+            row.update(self.payload)
+            self.db.realtime.publish(self.table, "UPDATE", row, old)
+        return rows
+
+    def _upsert(self):
+        self._count, result = None, []
+        for new in (self.payload if isinstance(self.payload, list) else [self.payload]):
+            row = next((r for r in self.db.tables[self.table] if all(r.get(c) == new.get(c) for c in self.on_conflict)), None)
+            if row is None: result.append(self.db.insert_row(self.table, new))
+            else:
+                old = dict(row)
+                row.update(new); result.append(row)
+                self.db.realtime.publish(self.table, "UPDATE", row, old)
+        return result
+
+
+class FakeBucket:
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    def upload(self, path, file, file_options=None):
+        if self.db.latency: time.sleep(self.db.latency)
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        with self.db.lock:
+            if path in self.db.objects[self.name] and not upsert: raise RuntimeError(f"Duplicate: {path}")
+            self.db.objects[self.name][path] = bytes(file)
+        return SimpleNamespace(path=path, full_path=f"{self.name}/{path}")
+
+    def get_public_url(self, path, options=None):
+        return f"https://fake.supabase.local/storage/v1/object/public/{self.name}/{path}"
+
+
+class FakeSupabase:
+    """메모리 안에서 동작하는 supabase.Client 대역. 테이블은 행(dict) 리스트, id 는 테이블별로 1부터 증가한다.
+
+    latency(초)는 요청 한 번(execute, rpc, storage 업로드)마다 더해지는 왕복 지연이다.
+    """
+
+    def __init__(self, users=None, logs=None, latency=0.0):
+        self.lock, self.latency = threading.RLock(), latency
+        self.realtime = FakeRealtime()
+        self.tables, self.next_ids = {"users": [], "logs": []}, {}
+        self.objects = {}
+        self.functions = {"award_exp": award_exp, "apply_daily_rollups": apply_daily_rollups}
+        for row in users if users is not None else default_users(): self.insert_row("users", row)
+        for row in logs or []: self.insert_row("logs", row)
+        self.storage = SimpleNamespace(from_=self._bucket)
+
+    def _bucket(self, name):
+        self.objects.setdefault(name, {})
+        return FakeBucket(self, name)
+
+    def insert_row(self, table, row):
+        with self.lock:
+            rows = self.tables.setdefault(table, [])
+            row = {"created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(), **row}
+            if table == "logs": row.setdefault("is_bookmarked", False)
+            if "id" not in row and table != "users":
+                self.next_ids[table] = self.next_ids.get(table, 0) + 1
+                row["id"] = self.next_ids[table]
+            rows.append(row)
+            self.realtime.publish(table, "INSERT", row)
+            return row
+
+    def table(self, name):
+        self.tables.setdefault(name, [])
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        def execute():
+            if self.latency: time.sleep(self.latency)
+            with self.lock: return SimpleNamespace(data=copy.deepcopy(self.functions[name](self, **(params or {}))), count=None)
+        return SimpleNamespace(execute=execute)
+
+
+class FakeRealtime:
+    """Supabase Realtime 대역. FakeSupabase 의 쓰기를 구독 중인 채널로 흘려보낸다 (live_updates.LiveFeed 의 연결 대상)."""
+
+    def __init__(self):
+        self.channels, self.lock = [], threading.Lock()
+
+    def channel(self, topic, params=None):
+        return FakeChannel(self, topic)
+
+    def publish(self, table, event, record, old_record=None):
+        with self.lock: channels = list(self.channels)
+        if not channels: return
+        payload = {"data": {"schema": "public", "table": table, "type": event, "commit_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                            "errors": None, "columns": [], "record": copy.deepcopy(record), "old_record": copy.deepcopy(old_record or {})}, "ids": []}
+        for channel in channels: channel.deliver(payload)
+
+
+class FakeChannel:
+    """postgres_changes 바인딩만 흉내 낸다. 필터는 column=eq.value 형식만 지원하고, 콜백은 구독한 이벤트 루프에서 실행된다."""
+
+    def __init__(self, hub, topic):
+        self.hub, self.topic, self.bindings, self.loop = hub, topic, [], None
+
+    def on_postgres_changes(self, event, callback, table=None, schema=None, filter=None):
+        column, _, value = (filter or "").partition("=eq.")
+        self.bindings.append((getattr(event, "value", event), table, column, value, callback))
+        return self
+
+    async def subscribe(self, callback=None):
+        self.loop = asyncio.get_running_loop()
+        with self.hub.lock: self.hub.channels.append(self)
+        if callback: callback("SUBSCRIBED", None)
+        return self
+
+    async def unsubscribe(self):
+        with self.hub.lock:
+            if self in self.hub.channels: self.hub.channels.remove(self)
+
+    def deliver(self, payload):
+        data = payload["data"]
+        row = data["record"] or data["old_record"]
+        for event, table, column, value, callback in self.bindings:
+            if event in ("*", data["type"]) and table in (None, "*", data["table"]) and (not column or str(row.get(column)) == value):
+                self.loop.call_soon_threadsafe(callback, payload)
+
+
+def default_users():
+    return [
+        {"user_id": "joshua", "name": "조슈아", "role": "student", "status": "studying", "detail_permission": False, "level": 1, "exp": 0},
+        {"user_id": "parent_joshua", "name": "조슈아 학부모", "role": "parent", "status": None, "detail_permission": False, "level": 1, "exp": 0},
+    ]
+
+
+SEED_QUESTIONS = {
+    "수학": ("일차방정식 3x + 5 = 20 풀이", "분수의 나눗셈은 왜 뒤집어서 곱해?", "피타고라스 정리 증명"),
+    "과학": ("광합성에 필요한 것", "뉴턴 제2법칙 예시", "산화와 환원의 차이"),
+    "영어": ("현재완료 시제 용법", "관계대명사 which 와 that", "to부정사의 명사적 용법"),
+    "국어": ("비유법과 상징의 차이", "훈민정음 창제 원리", "설명문의 짜임"),
+}
+SEED_CONCEPTS = {"수학": ("일차방정식", "분수의 나눗셈", "피타고라스 정리"), "과학": ("광합성", "운동 법칙", "산화 환원"),
+                 "영어": ("현재완료", "관계대명사", "to부정사"), "국어": ("비유법", "훈민정음", "설명문")}
+
+
+def seed_logs(db, user_id, count, days=30, vision_ratio=0.2, seed=0):
+    """user_id 에게 최근 days 일에 걸친 로그 count 개(일부는 채점 결과가 딸린 Vision 로그)를 시간순으로 채운다."""
+    rng = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    step = datetime.timedelta(days=days) / max(count, 1)
+    for i in range(count):
+        subject = rng.choice(tuple(SEED_QUESTIONS))
+        created_at = (now - step * (count - i)).isoformat()
+        if rng.random() < vision_ratio:
+            log = db.insert_row("logs", {"user_id": user_id, "subject": subject, "question": "[사진 문제 채점]", "answer": "가짜 채점 결과",
+                                         "image_url": None, "log_type": "Vision", "created_at": created_at})
+            for n in range(1, rng.randint(2, 5)):
+                db.insert_row("grading_results", {"log_id": log["id"], "user_id": user_id, "subject": subject, "question_number": f"{n}번",
+                                                  "is_correct": rng.random() < 0.7, "core_concept": rng.choice(SEED_CONCEPTS[subject]), "created_at": created_at})
+        else:
+            db.insert_row("logs", {"user_id": user_id, "subject": subject, "question": rng.choice(SEED_QUESTIONS[subject]),
+                                   "answer": "가짜 튜터 답변입니다.", "image_url": None, "log_type": "Text", "created_at": created_at})
+    return db
+
+
+_installed = {}
+
+
+def install(supabase=None, groq=None):
+    """FAKE_SUPABASE / FAKE_GROQ 가 켜졌을 때 app.py 가 새로 만들지 않고 이 인스턴스를 쓰게 한다. None 이면 해제."""
+    _installed.update(supabase=supabase, groq=groq)
+
+
+def installed(name):
+    return _installed.get(name)
@@ -0,0 +1,202 @@
+"""프로세스 전역 Groq 요청 스케줄러.
+
+모델별 동시 요청 수와 분당 토큰(TPM) 예산을 지키면서, 우선순위가 높은 요청(채팅)을 백그라운드 작업(리포트,
+문제 은행 보충)보다 먼저 내보낸다. 429/5xx/연결 오류는 지터가 섞인 지수 백오프로 재시도하고, 대기열이 깊어지면
+더 작은 모델로 돌린다. Streamlit 에 의존하지 않는다.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+import groq
+
+INTERACTIVE, NORMAL, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NORMAL: "normal", BACKGROUND: "background"}
+
+IMAGE_TOKEN_ESTIMATE = 1500  # 이미지 한 장당 입력 토큰 어림값
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+
+class ModelBudget:
+    def __init__(self, max_concurrency, tokens_per_minute, fallback=None, fallback_queue_depth=None):
+        self.max_concurrency, self.tokens_per_minute = max_concurrency, tokens_per_minute
+        self.fallback, self.fallback_queue_depth = fallback, fallback_queue_depth
+
+
+DEFAULT_BUDGETS = {
+    "llama-3.3-70b-versatile": ModelBudget(8, 300_000, fallback="llama-3.1-8b-instant", fallback_queue_depth=6),
+    "llama-3.1-8b-instant": ModelBudget(16, 250_000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": ModelBudget(8, 300_000),
+}
+
+
+def estimate_tokens(messages, max_tokens):
+    """문자 2개당 1토큰 정도로 입력을 어림하고, 출력은 max_tokens 만큼 잡는다."""
+    chars, images = 0, 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str): chars += len(content)
+        else:
+            for part in content:
+                if part.get("type") == "image_url": images += 1
+                else: chars += len(part.get("text", ""))
+    return chars // 2 + images * IMAGE_TOKEN_ESTIMATE + (max_tokens or 1024)
+
+
+class _Lane:
+    """모델 하나의 대기열. 우선순위 → 도착 순으로 줄을 세우고, 동시성/토큰 예산이 허락할 때 내보낸다."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.cond = threading.Condition()
+        self.waiting, self.active = [], 0
+        self.tokens, self.refilled_at = float(budget.tokens_per_minute), time.monotonic()
+        self.stats = {"requests": 0, "retries": 0, "fallbacks": 0, "errors": 0, "wait_seconds": 0.0}
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.budget.tokens_per_minute / 60
+        self.tokens = min(self.budget.tokens_per_minute, self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+
+    def acquire(self, ticket, cost):
+        cost = min(cost, self.budget.tokens_per_minute)
+        started = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                self._refill()
+                if self.waiting[0] == ticket and self.active < self.budget.max_concurrency and self.tokens >= cost: break
+                shortfall = max(0.0, cost - self.tokens) / (self.budget.tokens_per_minute / 60)
+                self.cond.wait(timeout=min(max(shortfall, 0.05), 1.0))
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.tokens -= cost
+            self.stats["requests"] += 1
+            self.stats["wait_seconds"] += time.monotonic() - started
+            self.cond.notify_all()
+
+    def release(self, refund=0):
+        with self.cond:
+            self.active -= 1
+            self.tokens = min(self.budget.tokens_per_minute, self.tokens + max(0, refund))
+            self.cond.notify_all()
+
+    def depth(self):
+        with self.cond: return len(self.waiting)
+
+    def count(self, key, amount=1):
+        with self.cond: self.stats[key] += amount
+
+
+class GroqScheduler:
+    def __init__(self, client, budgets=None, max_retries=4, base_delay=0.5, max_delay=16.0, tracer=None):
+        self.client, self.tracer = client, tracer
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.max_retries, self.base_delay, self.max_delay = max_retries, base_delay, max_delay
+        self.lanes, self.lock, self.seq = {}, threading.Lock(), itertools.count()
+
+    def _lane(self, model):
+        with self.lock:
+            if model not in self.lanes: self.lanes[model] = _Lane(self.budgets.get(model) or ModelBudget(4, 100_000))
+            return self.lanes[model]
+
+    def _route(self, model, allow_fallback):
+        """대기열이 기준보다 깊으면 예비 모델로 돌린다."""
+        budget = self.budgets.get(model)
+        if allow_fallback and budget and budget.fallback and budget.fallback_queue_depth is not None and self._lane(model).depth() >= budget.fallback_queue_depth:
+            self._lane(model).count("fallbacks")
+            return budget.fallback
+        return model
+
+    @staticmethod
+    def _retry_after(error):
+        retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+        try: return float(retry_after) if retry_after else 0.0
+        except ValueError: return 0.0
+
+    def _backoff(self, attempt, error):
+        """지터 섞인 지수 백오프. Retry-After 를 따르되 max_delay 를 넘지 않는다."""
+        return min(self.max_delay, max(self._retry_after(error), random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))))
+
+    def create(self, priority=NORMAL, allow_fallback=True, **kwargs):
+        """chat.completions.create 와 같은 인자를 받는다. stream=True 면 스트림을 다 읽을 때까지 슬롯을 잡고 있는다."""
+        cost = estimate_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        model = self._route(kwargs["model"], allow_fallback)
+        trace = {"started": time.perf_counter(), "tags": self.tracer.tags() if self.tracer else None,
+                 "attrs": {"model": model, "priority": PRIORITY_NAMES.get(priority, priority), "fallback": model != kwargs["model"], "queue_ms": 0.0}}
+        for attempt in range(self.max_retries + 1):
+            lane = self._lane(model)
+            waited = time.perf_counter()
+            lane.acquire((priority, next(self.seq)), cost)
+            trace["attrs"]["queue_ms"] += round((time.perf_counter() - waited) * 1000, 2)
+            trace["attrs"]["retries"] = attempt
+            try: response = self.client.chat.completions.create(**{**kwargs, "model": model})
+            except RETRYABLE_ERRORS as e:
+                lane.release()
+                # 화면이 기다리는 요청은 서버가 max_delay 보다 오래 쉬라고 하면 기다리지 않고 바로 예비 모델/오류로 넘어간다
+                if attempt == self.max_retries or (priority == INTERACTIVE and self._retry_after(e) > self.max_delay):
+                    lane.count("errors")
+                    fallback = self.budgets.get(model) and self.budgets[model].fallback
+                    if allow_fallback and fallback and isinstance(e, groq.RateLimitError):
+                        lane.count("fallbacks")
+                        return self.create(priority, allow_fallback=False, **{**kwargs, "model": fallback})
+                    self._trace(trace, error=type(e).__name__)
+                    raise
+                lane.count("retries")
+                time.sleep(self._backoff(attempt, e))
+                continue
+            except Exception as e:
+                lane.release()
+                lane.count("errors")
+                self._trace(trace, error=type(e).__name__)
+                raise
+            if kwargs.get("stream"): return _HeldStream(response, lane, cost, lambda **attrs: self._trace(trace, **attrs))
+            usage = getattr(response, "usage", None)
+            lane.release(refund=cost - usage.total_tokens if usage and getattr(usage, "total_tokens", None) else 0)
+            self._trace(trace, prompt_tokens=getattr(usage, "prompt_tokens", None), completion_tokens=getattr(usage, "completion_tokens", None))
+            return response
+
+    def _trace(self, trace, **attrs):
+        if self.tracer: self.tracer.record(f"groq.{trace['attrs']['model']}", time.perf_counter() - trace["started"], tags=trace["tags"], **trace["attrs"], **attrs)
+
+    def metrics(self):
+        """모델별 대기열 깊이, 처리 중 요청 수, 남은 토큰 예산과 누적 카운터."""
+        with self.lock: lanes = dict(self.lanes)
+        result = {}
+        for model, lane in lanes.items():
+            with lane.cond:
+                lane._refill()
+                by_priority = {PRIORITY_NAMES.get(p, str(p)): sum(1 for t in lane.waiting if t[0] == p) for p in PRIORITY_NAMES}
+                result[model] = {"queued": len(lane.waiting), "queued_by_priority": by_priority, "active": lane.active,
+                                 "tokens_available": int(lane.tokens), **{k: round(v, 3) for k, v in lane.stats.items()}}
+        return result
+
+
+class _HeldStream:
+    """스트림을 끝까지 읽거나(또는 버려질 때) 모델 슬롯과, 마지막 청크의 x_groq.usage 로 알게 된 남는 토큰 예산을 돌려준다.
+    첫 토큰까지의 시간과 토큰 사용량도 함께 기록한다."""
+
+    def __init__(self, stream, lane, cost, on_close=None):
+        self.stream, self.lane, self.cost, self.on_close, self.released = stream, lane, cost, on_close, False
+        self.opened, self.first_token_ms, self.usage = time.perf_counter(), None, None
+
+    def __iter__(self):
+        try:
+            for chunk in self.stream:
+                if self.first_token_ms is None: self.first_token_ms = round((time.perf_counter() - self.opened) * 1000, 2)
+                self.usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or self.usage
+                yield chunk
+        finally: self.close()
+
+    def close(self):
+        if self.released: return
+        self.released = True
+        total = getattr(self.usage, "total_tokens", None)
+        self.lane.release(refund=self.cost - total if total else 0)
+        if self.on_close: self.on_close(first_token_ms=self.first_token_ms, prompt_tokens=getattr(self.usage, "prompt_tokens", None), completion_tokens=getattr(self.usage, "completion_tokens", None))
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,88 @@
+"""비전 채점용 이미지 전처리/인코딩.
+
+Streamlit 에 의존하지 않으므로 app.py 와 benchmarks/ 양쪽에서 가져다 쓴다.
+"""
+import io
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+from pillow_heif import register_heif_opener
+
+register_heif_opener()
+
+VISION_MAX_DIM = 1600          # 긴 변 최대 픽셀. 손글씨 판독에 충분하면서 비전 모델 입력 토큰을 줄이는 선
+VISION_MAX_BYTES = 350 * 1024  # 비전 요청/저장소 업로드용 JPEG 목표 크기
+THUMBNAIL_MAX_DIM = 640        # 화면 표시용 썸네일
+JPEG_QUALITY_RANGE = (40, 90)
+PDF_RENDER_DPI = 150
+
+
+def fix_orientation(img):
+    """EXIF Orientation 태그대로 회전시킨다 (폰 사진이 눕는 문제)."""
+    return ImageOps.exif_transpose(img) or img
+
+
+def cap_dimension(img, max_dim):
+    if max(img.size) <= max_dim: return img
+    scale = max_dim / max(img.size)
+    return img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def normalize_worksheet(img):
+    """흑백 변환 후 자동 대비 보정. 종이 문제지의 그림자/누런 배경을 걷어낸다."""
+    return ImageOps.autocontrast(ImageOps.grayscale(img), cutoff=1)
+
+
+def prepare_for_grading(img, worksheet=False, max_dim=VISION_MAX_DIM):
+    """(채점용 이미지, 표시용 썸네일)을 돌려준다."""
+    img = cap_dimension(fix_orientation(img), max_dim)
+    if worksheet: img = normalize_worksheet(img)
+    elif img.mode != "RGB": img = img.convert("RGB")
+    return img, cap_dimension(img, THUMBNAIL_MAX_DIM)
+
+
+def pdf_page_count(data):
+    with fitz.open(stream=data, filetype="pdf") as doc: return doc.page_count
+
+
+def decode_upload(data):
+    """사진 바이트를 방향을 바로잡은 RGB 이미지로."""
+    img = fix_orientation(Image.open(io.BytesIO(data)))
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def render_pages(data, pdf_pages=None, worksheet=False):
+    """업로드 바이트 → [(채점용 이미지, 썸네일)]. pdf_pages 가 None 이면 사진 한 장, 아니면 그 쪽들을 PDF_RENDER_DPI 로 렌더링한다."""
+    if pdf_pages is None: return [prepare_for_grading(decode_upload(data), worksheet)]
+    pages = []
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for index in pdf_pages:
+            pix = doc.load_page(index).get_pixmap(dpi=PDF_RENDER_DPI)
+            pages.append(prepare_for_grading(Image.frombytes("RGB", [pix.width, pix.height], pix.samples), worksheet))
+    return pages
+
+
+def encode_jpeg(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def encode_to_budget(img, max_bytes=VISION_MAX_BYTES, quality_range=JPEG_QUALITY_RANGE):
+    """max_bytes 이하가 되는 가장 높은 JPEG 품질을 이분 탐색으로 찾는다.
+
+    최저 품질로도 넘치면 해상도를 15%씩 줄여 다시 시도한다. (JPEG 바이트, 품질)을 돌려준다.
+    """
+    low, high = quality_range
+    while True:
+        data = encode_jpeg(img, high)
+        if len(data) <= max_bytes: return data, high  # 대부분의 문제지는 최고 품질로도 예산 안에 들어온다
+        best, lo, hi = None, low, high - 1
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            data = encode_jpeg(img, mid)
+            if len(data) <= max_bytes: best, lo = (data, mid), mid + 1
+            else: hi = mid - 1
+        if best: return best
+        if max(img.size) <= THUMBNAIL_MAX_DIM: return encode_jpeg(img, low), low
+        img = cap_dimension(img, int(max(img.size) * 0.85))
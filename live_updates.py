@@ -0,0 +1,84 @@
+"""Supabase Realtime 구독으로 users/logs 변경을 받아 캐시에 반영하는 백그라운드 피드.
+
+supabase-py 의 realtime 은 비동기 클라이언트에서만 동작하므로, 피드가 자기 스레드에 asyncio 루프를 띄우고 사용자별
+채널(user_id=eq.<id>)을 연다. 변경 한 건은 on_change(table, event, record) 로 넘기고, 캐시가 실제로 바뀐 경우에만
+(table, user_id) 버전을 올린다. 화면은 이 버전만 비교해 다시 그릴지 정하므로 DB 를 폴링하지 않는다.
+Streamlit 에 의존하지 않는다.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+
+TABLES = ("users", "logs")
+
+
+class LiveFeed:
+    def __init__(self, connect, on_change, tracer=None):
+        """connect: 채널을 만들 수 있는 클라이언트(supabase AsyncClient 또는 fakes.FakeRealtime)를 돌려주는 코루틴 함수."""
+        self.on_change, self.tracer = on_change, tracer
+        self.versions, self.users = Counter(), {}
+        self.watched, self.subscribed_at, self.channels = set(), {}, {}
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="realtime-feed", daemon=True).start()
+        self.client = asyncio.run_coroutine_threadsafe(connect(), self.loop)
+
+    def watch(self, user_id):
+        """user_id 의 users/logs 변경을 구독한다. 이미 구독 중이면 아무 일도 하지 않는다."""
+        with self.lock:
+            if user_id in self.watched: return
+            self.watched.add(user_id)
+        asyncio.run_coroutine_threadsafe(self._subscribe(user_id), self.loop)
+
+    async def _subscribe(self, user_id):
+        try:
+            client = await asyncio.wrap_future(self.client)
+            channel = self.channels[user_id] = client.channel(f"live-{user_id}")
+            for table in TABLES:
+                channel.on_postgres_changes("*", callback=self._dispatch, table=table, schema="public", filter=f"user_id=eq.{user_id}")
+            await channel.subscribe(lambda state, error=None: self._on_state(user_id, state))
+        except Exception:
+            with self.lock: self.watched.discard(user_id)  # 다음 watch() 때 다시 시도
+
+    def _on_state(self, user_id, state):
+        """SUBSCRIBED 가 아닌 상태(CLOSED, CHANNEL_ERROR, TIMED_OUT)면 채널을 닫고 구독을 풀어, 다음 watch() 때 새로 구독한다."""
+        with self.lock:
+            if getattr(state, "value", state) == "SUBSCRIBED":
+                self.subscribed_at[user_id] = time.monotonic(); return
+            self.subscribed_at.pop(user_id, None)
+            self.watched.discard(user_id)
+            channel = self.channels.pop(user_id, None)
+        if channel: asyncio.run_coroutine_threadsafe(self._close(channel), self.loop)
+
+    async def _close(self, channel):
+        try: await channel.unsubscribe()
+        except Exception: pass  # 이미 끊긴 채널
+
+    def _dispatch(self, payload):
+        data = payload["data"]
+        table, event = data["table"], getattr(data["type"], "value", data["type"])
+        record = data.get("record") or data.get("old_record") or {}
+        user_id = record.get("user_id")
+        started = time.perf_counter()
+        try: changed, failed = self.on_change(table, event, record), False
+        except Exception: changed, failed = True, True
+        with self.lock:
+            if table == "users" and event != "DELETE": self.users[user_id] = dict(record)
+            if changed: self.versions[(table, user_id)] += 1
+            if failed and user_id in self.subscribed_at: self.subscribed_at[user_id] = time.monotonic()  # 캐시가 어긋났을 수 있으니 한 번은 다시 조회
+        if self.tracer: self.tracer.record(f"realtime.{table}", time.perf_counter() - started, tags={}, event=event, changed=changed)
+
+    def live_since(self, user_id):
+        """user_id 구독이 확인된 시각(time.monotonic). 구독 중이 아니면 None. 이 시각 이후에 조회한 캐시는 최신으로 유지된다."""
+        with self.lock: return self.subscribed_at.get(user_id)
+
+    def snapshot(self, user_ids):
+        with self.lock: return {(table, user_id): self.versions[(table, user_id)] for user_id in user_ids for table in TABLES}
+
+    def changed(self, snapshot):
+        """snapshot 이후 버전이 오른 (table, user_id) 집합."""
+        with self.lock: return {key for key, version in snapshot.items() if self.versions[key] != version}
+
+    def user_row(self, user_id):
+        with self.lock: return dict(self.users[user_id]) if user_id in self.users else None
@@ -0,0 +1,42 @@
+-- 사진 채점 결과를 문항 단위로 펼쳐 저장하는 인덱스 테이블
+-- logs.answer 의 JSON 을 매번 파싱하지 않고 정답률/오답 개념/일별 추이를 집계하기 위함
+create table if not exists public.grading_results (
+    id bigint generated by default as identity primary key,
+    log_id bigint not null references public.logs (id) on delete cascade,
+    user_id text not null,
+    question_number text not null,
+    is_correct boolean not null default false,
+    core_concept text not null default '기타',
+    subject text,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists grading_results_user_id_id_idx on public.grading_results (user_id, id desc);
+create index if not exists grading_results_log_id_idx on public.grading_results (log_id);
+
+-- 기존 Vision 로그 백필 (JSON 파싱에 실패한 로그는 건너뜀)
+do $$
+declare
+    r record;
+begin
+    for r in
+        select l.id, l.user_id, l.subject, l.answer, l.created_at
+        from public.logs l
+        where l.log_type = 'Vision'
+          and not exists (select 1 from public.grading_results g where g.log_id = l.id)
+    loop
+        begin
+            insert into public.grading_results (log_id, user_id, question_number, is_correct, core_concept, subject, created_at)
+            select r.id,
+                   r.user_id,
+                   coalesce(item ->> 'question_number', ord || '번'),
+                   coalesce((item ->> 'is_correct')::boolean, false),
+                   coalesce(nullif(item ->> 'core_concept', ''), '기타'),
+                   r.subject,
+                   r.created_at
+            from jsonb_array_elements(r.answer::jsonb -> 'results') with ordinality as t (item, ord);
+        exception when others then
+            raise notice 'grading_results backfill skipped log %: %', r.id, sqlerrm;
+        end;
+    end loop;
+end $$;
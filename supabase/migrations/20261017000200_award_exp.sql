@@ -0,0 +1,35 @@
+-- EXP 지급을 한 번의 RPC로 원자적으로 처리한다.
+-- 행 잠금(for update)으로 동시 지급 시 경험치 유실을 막고, 여러 레벨을 한 번에 넘는 경우도 서버에서 모두 처리한다.
+-- 레벨업 필요 경험치: 현재 레벨 * 100 (Lv.1: 100, Lv.2: 200...)
+create or replace function public.award_exp(p_user_id text, p_amount integer)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_level integer;
+    v_exp integer;
+    v_start_level integer;
+begin
+    select coalesce(u.level, 1), coalesce(u.exp, 0)
+      into v_level, v_exp
+      from public.users u
+     where u.user_id = p_user_id
+       for update;
+    if not found then
+        return null;
+    end if;
+
+    v_start_level := v_level;
+    v_exp := v_exp + p_amount;
+    while v_exp >= v_level * 100 loop
+        v_exp := v_exp - v_level * 100;
+        v_level := v_level + 1;
+    end loop;
+
+    update public.users u
+       set level = v_level, exp = v_exp
+     where u.user_id = p_user_id;
+
+    return jsonb_build_object('user_id', p_user_id, 'level', v_level, 'exp', v_exp, 'levels_gained', v_level - v_start_level);
+end;
+$$;
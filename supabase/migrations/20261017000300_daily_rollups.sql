@@ -0,0 +1,19 @@
+-- 학부모 대시보드용 학생별 일별 집계 (날짜는 KST 기준)
+-- app.py 의 refresh_daily_rollups() 가 rollup_state 의 워터마크 이후 새 로그/채점 결과만 읽어 누적한다.
+create table if not exists public.daily_rollups (
+    user_id text not null,
+    day date not null,
+    questions_by_subject jsonb not null default '{}'::jsonb,  -- {"수학": 3, ...}
+    graded_items integer not null default 0,
+    correct_items integer not null default 0,
+    wrong_concepts jsonb not null default '{}'::jsonb,        -- {"분수의 나눗셈": 2, ...}
+    active_minutes double precision not null default 0,
+    primary key (user_id, day)
+);
+
+create table if not exists public.rollup_state (
+    user_id text primary key,
+    last_log_id bigint not null default 0,
+    last_grade_id bigint not null default 0,
+    last_activity_at timestamptz
+);
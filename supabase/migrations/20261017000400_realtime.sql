@@ -0,0 +1,3 @@
+-- users/logs 변경을 Supabase Realtime 으로 내보낸다 (학생/학부모 화면의 실시간 반영).
+-- 앱은 user_id=eq.<id> 필터로 구독하므로 필터 컬럼이 들어 있는 새 행(record)만 있으면 된다.
+alter publication supabase_realtime add table public.users, public.logs;
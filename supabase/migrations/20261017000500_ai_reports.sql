@@ -0,0 +1,12 @@
+-- 학생별 AI 리포트 캐시 (취약점 진단, 추천 개념)
+-- app.py 의 get_ai_report() 가 롤업 요약으로 만든 리포트를 저장하고, 새 근거(질문+채점 문항)가 충분히 쌓였을 때만 다시 만든다.
+create table if not exists public.ai_reports (
+    user_id text not null,
+    kind text not null,                      -- 'vulnerability' | 'recommendations'
+    report text not null,
+    evidence integer not null default 0,     -- 생성 시점의 누적 질문 수 + 채점 문항 수
+    last_log_id bigint not null default 0,   -- 생성 시점의 rollup_state 워터마크
+    last_grade_id bigint not null default 0,
+    generated_at timestamptz not null default now(),
+    primary key (user_id, kind)
+);
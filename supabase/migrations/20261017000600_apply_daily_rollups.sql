@@ -0,0 +1,53 @@
+-- 일별 롤업 누적과 rollup_state 워터마크 이동을 한 트랜잭션으로 처리한다.
+-- app.py 의 refresh_daily_rollups() 가 워터마크 이후 새 로그/채점 결과로 만든 일별 증분(p_deltas)을 넘긴다.
+-- 워터마크가 읽은 시점 값(p_from_*)과 다르면 다른 프로세스가 이미 반영한 것이므로 아무것도 하지 않고 false 를 돌려준다.
+-- 워터마크는 id 이므로 커밋이 늦은 더 작은 id 는 건너뛸 수 있다. 앱은 ROLLUP_SETTLE_SECONDS 보다 오래된 행까지만 넘겨서
+-- 이를 피한다 (그보다 오래 열려 있는 INSERT 트랜잭션이 있으면 그 행은 롤업에서 빠진다).
+create or replace function public.jsonb_add_counts(a jsonb, b jsonb)
+returns jsonb
+language sql
+immutable
+as $$
+    select coalesce(jsonb_object_agg(key, total), '{}'::jsonb)
+      from (select key, sum(value::numeric) as total
+              from (select * from jsonb_each_text(coalesce(a, '{}'::jsonb))
+                    union all
+                    select * from jsonb_each_text(coalesce(b, '{}'::jsonb))) counts
+             group by key) merged;
+$$;
+
+create or replace function public.apply_daily_rollups(
+    p_user_id text,
+    p_deltas jsonb,
+    p_from_log_id bigint,
+    p_from_grade_id bigint,
+    p_last_log_id bigint,
+    p_last_grade_id bigint,
+    p_last_activity_at timestamptz)
+returns boolean
+language plpgsql
+as $$
+begin
+    insert into public.rollup_state (user_id) values (p_user_id) on conflict (user_id) do nothing;
+    -- 행 잠금으로 동시 호출을 줄 세우고, 먼저 끝난 쪽이 워터마크를 옮겼으면 뒤쪽은 여기서 빠진다
+    update public.rollup_state s
+       set last_log_id = p_last_log_id, last_grade_id = p_last_grade_id, last_activity_at = p_last_activity_at
+     where s.user_id = p_user_id
+       and s.last_log_id = p_from_log_id
+       and s.last_grade_id = p_from_grade_id;
+    if not found then
+        return false;
+    end if;
+
+    insert into public.daily_rollups as r (user_id, day, questions_by_subject, graded_items, correct_items, wrong_concepts, active_minutes)
+    select p_user_id, d.day, d.questions_by_subject, d.graded_items, d.correct_items, d.wrong_concepts, d.active_minutes
+      from jsonb_to_recordset(p_deltas) as d(day date, questions_by_subject jsonb, graded_items integer, correct_items integer, wrong_concepts jsonb, active_minutes double precision)
+    on conflict (user_id, day) do update
+       set questions_by_subject = public.jsonb_add_counts(r.questions_by_subject, excluded.questions_by_subject),
+           graded_items = r.graded_items + excluded.graded_items,
+           correct_items = r.correct_items + excluded.correct_items,
+           wrong_concepts = public.jsonb_add_counts(r.wrong_concepts, excluded.wrong_concepts),
+           active_minutes = r.active_minutes + excluded.active_minutes;
+    return true;
+end;
+$$;
@@ -0,0 +1,5 @@
+-- 사진 채점 전에 같은 이미지의 기존 채점 결과를 찾는 조회(load_stored_grading)용 인덱스.
+-- 조회 조건이 user_id + image_url + log_type = 'Vision' 이고 최신 한 건만 보므로, Vision 로그만 담는 부분 인덱스로 충분하다.
+create index if not exists logs_vision_image_url_idx
+    on public.logs (user_id, image_url, id desc)
+    where log_type = 'Vision' and image_url is not null;
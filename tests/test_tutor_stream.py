@@ -0,0 +1,57 @@
+"""TutorStream 이 fakes.FakeGroq 스트림에서 [OFF_TOPIC] 태그를 청크 경계와 상관없이 걸러내는지."""
+import pytest
+
+from fakes import FakeGroq
+from tutor_stream import TutorStream
+
+CHUNK_SIZES = (1, 2, 3, 5, 64)
+
+
+def run(reply, chunk_size):
+    groq = FakeGroq(reply=lambda *args: reply, chunk_size=chunk_size, first_token_delay=0, token_delay=0)
+    stream = TutorStream(groq.chat.completions.create(model="test", messages=[{"role": "user", "content": "질문"}], stream=True))
+    return stream, list(stream)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_leading_tag_split_across_chunks(chunk_size):
+    stream, deltas = run("[OFF_TOPIC] 공부 얘기로 돌아가 볼까요?", chunk_size)
+    assert "".join(deltas) == stream.text == "공부 얘기로 돌아가 볼까요?"
+    assert stream.off_topic and stream.log_type == "Off_Topic" and stream.done
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_whitespace_before_tag(chunk_size):
+    stream, deltas = run("\n  [OFF_TOPIC]  쉬는 시간에 얘기해요.", chunk_size)
+    assert "".join(deltas) == stream.text == "쉬는 시간에 얘기해요."
+    assert stream.off_topic
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_leading_whitespace_without_tag(chunk_size):
+    stream, deltas = run("  근의 공식은 x = (-b ± √(b²-4ac)) / 2a 입니다.", chunk_size)
+    assert "".join(deltas) == "  근의 공식은 x = (-b ± √(b²-4ac)) / 2a 입니다."
+    assert stream.text == "근의 공식은 x = (-b ± √(b²-4ac)) / 2a 입니다."
+    assert not stream.off_topic and stream.log_type == "Text"
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_tag_mid_answer(chunk_size):
+    stream, _ = run("좋은 질문이에요. [OFF_TOPIC] 하지만 지금은 수학 시간이에요.", chunk_size)
+    assert stream.off_topic
+    assert stream.text == "좋은 질문이에요.  하지만 지금은 수학 시간이에요."
+
+
+@pytest.mark.parametrize("reply", ["[", "[OFF", "  [OFF_TOPIC"])
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_stream_ending_inside_tag_prefix(reply, chunk_size):
+    stream, deltas = run(reply, chunk_size)
+    assert "".join(deltas) == reply  # 태그로 판정되지 않은 보류분은 끝에서 그대로 내보낸다
+    assert stream.text == reply.strip()
+    assert not stream.off_topic and stream.done
+
+
+def test_bracket_that_is_not_the_tag():
+    stream, deltas = run("[참고] 분수의 덧셈은 통분부터 해요.", 2)
+    assert "".join(deltas) == stream.text == "[참고] 분수의 덧셈은 통분부터 해요."
+    assert not stream.off_topic
@@ -0,0 +1,159 @@
+"""핫패스 계측: 사용자/페이지/rerun 단위로 태그된 타이밍 스팬.
+
+스팬은 메모리 링 버퍼에 쌓이고(사이드바 패널용), 설정하면 기록 스레드가 flush_seconds 마다 모아서 JSONL 파일에
+덧붙이고 Prometheus 텍스트 파일을 다시 쓴다 (요청 스레드는 디스크를 기다리지 않는다).
+prometheus_text() 는 연산별 p50/p95 요약을 Prometheus 텍스트 형식으로 돌려준다. Streamlit 에 의존하지 않는다.
+"""
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+_tags = contextvars.ContextVar("trace_tags", default={})
+
+
+class Tracer:
+    def __init__(self, jsonl_path=None, prom_path=None, max_spans=5000, max_samples=2000, flush_seconds=1.0):
+        self.jsonl_path, self.prom_path = jsonl_path, prom_path
+        self.spans = deque(maxlen=max_spans)
+        self.samples = defaultdict(lambda: deque(maxlen=max_samples))  # op -> 최근 소요 시간(ms)
+        self.totals = defaultdict(lambda: [0, 0.0])                     # op -> [count, sum_ms]
+        self.pending = []                                               # 아직 파일에 쓰지 않은 스팬
+        self.lock, self.flush_lock = threading.Lock(), threading.Lock()
+        if jsonl_path or prom_path:
+            threading.Thread(target=self._flush_loop, args=(flush_seconds,), name="trace-writer", daemon=True).start()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def set_tags(**tags):
+        _tags.set({**_tags.get(), **tags})
+
+    @staticmethod
+    def tags():
+        return dict(_tags.get())
+
+    def record(self, op, duration, tags=None, **attrs):
+        """이미 측정한 구간을 기록한다. tags 를 주지 않으면 현재 컨텍스트의 태그를 쓴다."""
+        span = {"op": op, "ms": round(duration * 1000, 2), "ts": round(time.time(), 3), **(tags if tags is not None else _tags.get()), **attrs}
+        with self.lock:
+            self.spans.append(span)
+            self.samples[op].append(span["ms"])
+            self.totals[op][0] += 1
+            self.totals[op][1] += span["ms"]
+            if self.jsonl_path or self.prom_path: self.pending.append(span)
+        return span
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try: self.flush()
+            except OSError: pass  # 디스크 오류로 기록 스레드가 죽지 않게 한다 (그 사이 스팬은 버려진다)
+
+    def flush(self):
+        """쌓인 스팬을 JSONL 에 덧붙이고 Prometheus 파일을 새로 쓴다. 파일 I/O 는 스팬 락 밖에서 한다."""
+        with self.flush_lock:
+            with self.lock: spans, self.pending = self.pending, []
+            if not spans: return
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f: f.writelines(json.dumps(span, ensure_ascii=False, default=str) + "\n" for span in spans)
+            if self.prom_path:
+                with open(f"{self.prom_path}.tmp", "w", encoding="utf-8") as f: f.write(self.prometheus_text())
+                os.replace(f"{self.prom_path}.tmp", self.prom_path)  # 수집기가 반쯤 쓴 파일을 읽지 않도록
+
+    @contextmanager
+    def span(self, op, **attrs):
+        """with tracer.span("op") as s: ... s["bytes"] = n  처럼 속성을 덧붙일 수 있다."""
+        start = time.perf_counter()
+        try: yield attrs
+        except BaseException as e:
+            attrs.setdefault("error", type(e).__name__)
+            raise
+        finally: self.record(op, time.perf_counter() - start, **attrs)
+
+    def spans_for(self, **tags):
+        with self.lock: return [s for s in self.spans if all(s.get(k) == v for k, v in tags.items())]
+
+    def prometheus_text(self):
+        lines = ["# HELP focus_op_duration_ms Duration of traced operations in milliseconds.", "# TYPE focus_op_duration_ms summary"]
+        with self.lock:
+            for op in sorted(self.totals):
+                samples = sorted(self.samples[op])
+                for q in (0.5, 0.95):
+                    lines.append(f'focus_op_duration_ms{{op="{op}",quantile="{q}"}} {samples[min(len(samples) - 1, int(q * len(samples)))]}')
+                lines.append(f'focus_op_duration_ms_sum{{op="{op}"}} {round(self.totals[op][1], 2)}')
+                lines.append(f'focus_op_duration_ms_count{{op="{op}"}} {self.totals[op][0]}')
+        return "\n".join(lines) + "\n"
+
+
+def payload_bytes(data):
+    try: return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError): return None
+
+
+class _TracedQuery:
+    """postgrest 요청 빌더를 감싸 execute() 를 스팬으로 기록한다. 체이닝된 메서드 결과도 계속 감싼다."""
+
+    def __init__(self, tracer, op, target):
+        self._tracer, self._op, self._target = tracer, op, target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr): return attr
+        op = f"{self._op}.{name}" if name in ("select", "insert", "update", "upsert", "delete") else self._op
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _TracedQuery(self._tracer, op, result) if hasattr(result, "execute") else result
+        return call
+
+    def execute(self):
+        with self._tracer.span(self._op) as span:
+            res = self._target.execute()
+            data = getattr(res, "data", None)
+            span["rows"] = len(data) if isinstance(data, list) else int(data is not None)
+            span["bytes"] = payload_bytes(data)
+            return res
+
+
+class _TracedBucket:
+    def __init__(self, tracer, name, target):
+        self._tracer, self._name, self._target = tracer, name, target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+    def upload(self, path, file, *args, **kwargs):
+        with self._tracer.span(f"storage.{self._name}.upload", bytes=len(file) if isinstance(file, (bytes, bytearray)) else None):
+            return self._target.upload(path, file, *args, **kwargs)
+
+
+class TracedSupabase:
+    """supabase.Client(또는 FakeSupabase) 대역. table()/rpc()/storage 호출을 모두 스팬으로 남긴다."""
+
+    def __init__(self, client, tracer):
+        self._client, self._tracer = client, tracer
+        self.storage = _TracedStorage(client.storage, tracer)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def table(self, name):
+        return _TracedQuery(self._tracer, f"supabase.{name}", self._client.table(name))
+
+    def rpc(self, name, params=None):
+        return _TracedQuery(self._tracer, f"supabase.rpc.{name}", self._client.rpc(name, params or {}))
+
+
+class _TracedStorage:
+    def __init__(self, storage, tracer):
+        self._storage, self._tracer = storage, tracer
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+    def from_(self, bucket):
+        return _TracedBucket(self._tracer, bucket, self._storage.from_(bucket))
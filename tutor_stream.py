@@ -0,0 +1,42 @@
+"""튜터 답변 스트리밍: Groq 스트림 청크를 도착하는 대로 내보내면서 [OFF_TOPIC] 태그를 걸러낸다.
+
+Streamlit 에 의존하지 않으므로 fakes.FakeGroq 스트림으로 바로 테스트할 수 있다.
+"""
+
+
+class TutorStream:
+    TAG = "[OFF_TOPIC]"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.text, self.off_topic, self.done = "", False, False
+
+    def __iter__(self):
+        head, deciding, trim = "", True, False
+        for chunk in self.chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta: continue
+            if deciding:
+                # 앞부분이 태그의 접두사인 동안은 보류했다가, 태그 여부가 결정되면 한 번에 내보낸다.
+                head += delta
+                stripped = head.lstrip()
+                if stripped.startswith(self.TAG): self.off_topic, trim, delta = True, True, stripped[len(self.TAG):]
+                elif self.TAG.startswith(stripped): continue
+                else: delta = head
+                deciding = False
+            if trim:  # 태그 뒤 공백은 다음 청크로 넘어와도 버린다
+                delta = delta.lstrip()
+                if not delta: continue
+                trim = False
+            self.text += delta
+            yield delta
+        if deciding and head:
+            self.text += head
+            yield head
+        if self.TAG in self.text: self.off_topic = True
+        self.text = self.text.replace(self.TAG, "").strip()
+        self.done = True
+
+    @property
+    def log_type(self):
+        return "Off_Topic" if self.off_topic else "Text"